@@ -0,0 +1,360 @@
+# activity_tracker.py - Event-driven window activity timeline
+
+import os
+import time
+import struct
+import threading
+from array import array
+from config import (
+    ACTIVITY_LOG_FILE, API_ACTIVITY_UPLOAD_URL, ACTIVITY_POLL_INTERVAL,
+    ACTIVITY_PUSH_POLL_INTERVAL, ACTIVITY_UPLOAD_INTERVAL, ACTIVITY_UPLOAD_BATCH, ACTIVITY_MAX_PENDING_EVENTS
+)
+from debug_logger import log_activity
+from browser_monitor import get_browser_monitor
+from window_monitor import get_window_monitor
+from upload_engine import get_upload_engine
+from api_client import get_api_client, ENDPOINT_UNSUPPORTED_STATUSES
+
+# Append-only log records
+STRING_RECORD = struct.Struct('<BIH')   # type, string id, utf-8 length (+ bytes)
+EVENT_RECORD = struct.Struct('<BdIII')  # type, timestamp, app id, title id, domain id
+STRING_TYPE = 1
+EVENT_TYPE = 2
+AWAY_ID = 0  # Interned id 0 means "no app" (locked, asleep, nothing focused)
+
+
+class ActivityTracker:
+    """Record every focus change as compact (timestamp, app, title, domain) events"""
+
+    def __init__(self, auth_manager):
+        self.auth_manager = auth_manager
+        self.is_running = False
+        self.thread = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.upload_lock = threading.Lock()  # One upload at a time - a restarted tracker may overlap the old one
+        self.upload_supported = True  # Cleared if the server lacks the activity endpoint
+
+        # Interned strings - id 0 is reserved for AWAY_ID
+        self.strings = ['']
+        self.string_ids = {'': AWAY_ID}
+
+        # Timeline columns
+        self.timestamps = array('d')
+        self.app_ids = array('I')
+        self.title_ids = array('I')
+        self.domain_ids = array('I')
+
+        self.log_file = None
+        self.push_enabled = False
+        self.listening = False
+        self.last_tick = None
+        self.last_upload = time.time()
+        self.latest_sample = None  # (time, window info, browser url data) from the last observation
+        self._load_log()
+
+    def start(self):
+        """Start tracking focus changes"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.wake.clear()
+        with self.lock:
+            self.log_file = open(ACTIVITY_LOG_FILE, 'ab')
+
+        # Event-driven when the window backend pushes changes, polling otherwise
+        window_monitor = get_window_monitor()
+        self.push_enabled = bool(getattr(window_monitor, 'x11', None))
+        if self.push_enabled and not self.listening:
+            window_monitor.x11.add_listener(lambda info: self.wake.set())
+            self.listening = True
+
+        self.thread = threading.Thread(target=self._track_loop, daemon=True)
+        self.thread.start()
+        log_activity(f"Activity tracker started ({'push' if self.push_enabled else 'polling'})")
+
+    def stop(self):
+        """Stop tracking - closes the current segment; the tracker thread uploads it on its way out"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.thread = None  # The loop sees it is no longer current and exits
+        with self.lock:
+            self._append_locked(time.time(), AWAY_ID, AWAY_ID, AWAY_ID)
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
+        self.wake.set()
+
+    def _track_loop(self):
+        """Observe the active window on every push event or poll tick"""
+        interval = ACTIVITY_PUSH_POLL_INTERVAL if self.push_enabled else ACTIVITY_POLL_INTERVAL
+        current = threading.current_thread()
+        while self.thread is current:
+            try:
+                self._observe(current)
+                if time.time() - self.last_upload >= ACTIVITY_UPLOAD_INTERVAL:
+                    self.upload_pending()
+                    self._trim_backlog()
+            except Exception as e:
+                log_activity(f"Activity tracking error: {e}", 'error')
+            self.wake.wait(interval)
+            self.wake.clear()
+
+        # Stopped - flush the closed segment here rather than on the caller's (UI) thread
+        try:
+            self.upload_pending()
+        except Exception as e:
+            log_activity(f"Activity upload error: {e}", 'warning')
+
+    def _observe(self, thread):
+        """Append an event if the focused app/title/domain changed"""
+        now = time.time()
+        interval = ACTIVITY_PUSH_POLL_INTERVAL if self.push_enabled else ACTIVITY_POLL_INTERVAL
+        if self.last_tick and now - self.last_tick > interval * 3 + 5:
+            # The machine slept or the loop stalled - don't bill that time to the last app
+            self._append_event(self.last_tick, AWAY_ID, AWAY_ID, AWAY_ID)
+        self.last_tick = now
+
+        info = get_window_monitor().get_active_window_info()
+        if info:
+            process = info.get('process') or 'unknown'
+            title = info.get('title') or ''
+            url_data = get_browser_monitor().get_active_browser_url(title, process)
+            values = (process, title, url_data['domain'] if url_data else '')
+        else:
+            url_data = None
+            values = None
+        self.latest_sample = (now, info, url_data)
+
+        with self.lock:
+            if self.thread is not thread:
+                return  # Stopped meanwhile - the segment is already closed
+            # Ids are only valid under the lock - compaction renumbers them
+            current = tuple(self._intern(v) for v in values) if values else (AWAY_ID, AWAY_ID, AWAY_ID)
+            if self.app_ids and (self.app_ids[-1], self.title_ids[-1], self.domain_ids[-1]) == current:
+                return
+            self._append_locked(now, *current)
+
+    def latest_window(self):
+        """The last observed (window info, browser url data), or None if not tracking or stale
+
+        Lets other services share the tracker's sample instead of probing the
+        window system again - a subprocess per probe on some platforms.
+        """
+        sample = self.latest_sample
+        interval = ACTIVITY_PUSH_POLL_INTERVAL if self.push_enabled else ACTIVITY_POLL_INTERVAL
+        if not self.is_running or not sample or time.time() - sample[0] > interval * 2:
+            return None
+        return sample[1], sample[2]
+
+    def _intern(self, value):
+        """Map a string to a small integer id, logging new strings once - caller holds the lock"""
+        value = value[:1000]
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self.string_ids[value] = string_id
+            if self.log_file:
+                encoded = value.encode('utf-8')
+                self.log_file.write(STRING_RECORD.pack(STRING_TYPE, string_id, len(encoded)) + encoded)
+        return string_id
+
+    def _append_event(self, timestamp, app_id, title_id, domain_id):
+        with self.lock:
+            self._append_locked(timestamp, app_id, title_id, domain_id)
+
+    def _append_locked(self, timestamp, app_id, title_id, domain_id):
+        self.timestamps.append(timestamp)
+        self.app_ids.append(app_id)
+        self.title_ids.append(title_id)
+        self.domain_ids.append(domain_id)
+        if self.log_file:
+            self.log_file.write(EVENT_RECORD.pack(EVENT_TYPE, timestamp, app_id, title_id, domain_id))
+            self.log_file.flush()
+
+    def rollup(self, until=None, count=None):
+        """Seconds spent per app and per domain over the recorded timeline (or its first `count` events)"""
+        until = until or time.time()
+        apps, domains = {}, {}
+        with self.lock:
+            total = len(self.timestamps)
+            for i in range(min(total, count) if count is not None else total):
+                app_id = self.app_ids[i]
+                if app_id == AWAY_ID:
+                    continue
+                end = self.timestamps[i + 1] if i + 1 < total else until
+                seconds = max(0.0, end - self.timestamps[i])
+                app = self.strings[app_id]
+                apps[app] = apps.get(app, 0.0) + seconds
+                domain_id = self.domain_ids[i]
+                if domain_id != AWAY_ID:
+                    domain = self.strings[domain_id]
+                    domains[domain] = domains.get(domain, 0.0) + seconds
+        return {
+            'apps': {k: round(v, 1) for k, v in apps.items()},
+            'domains': {k: round(v, 1) for k, v in domains.items()}
+        }
+
+    def upload_pending(self):
+        """Upload the timeline and rollups recorded since the last upload, ACTIVITY_UPLOAD_BATCH events at a time"""
+        self.last_upload = time.time()
+        if not self.upload_supported:
+            return False
+        if not self.upload_lock.acquire(blocking=False):
+            return False  # Already uploading on another thread
+        try:
+            while True:
+                sent = self._upload_batch()
+                if sent is None:
+                    return False
+                if sent < ACTIVITY_UPLOAD_BATCH:
+                    return True
+        finally:
+            self.upload_lock.release()
+
+    def _upload_batch(self):
+        """POST the oldest pending events - returns how many were sent, None on failure"""
+        with self.lock:
+            total = len(self.timestamps)
+            if total == 0:
+                return 0
+            count = min(total, ACTIVITY_UPLOAD_BATCH)
+            events = [
+                [self.timestamps[i], self.strings[self.app_ids[i]],
+                 self.strings[self.title_ids[i]], self.strings[self.domain_ids[i]]]
+                for i in range(count)
+            ]
+            # A partial batch ends where the next event starts
+            period_end = self.timestamps[count] if count < total else time.time()
+        payload = {
+            'period_start': events[0][0],
+            'period_end': period_end,
+            'events': events,
+            **self.rollup(until=period_end, count=count)
+        }
+
+        headers = self.auth_manager.get_auth_header()
+        if not headers:
+            return None
+        try:
+            # Metadata-only - goes ahead of queued screenshot uploads
+            response = get_upload_engine().post(API_ACTIVITY_UPLOAD_URL, headers=headers, json=payload,
+                                                timeout=15, priority=True)
+        except Exception as e:
+            log_activity(f"Activity upload error: {e}", 'warning')
+            return None
+        if response.status_code in ENDPOINT_UNSUPPORTED_STATUSES:
+            log_activity(f"Activity upload not supported (HTTP {response.status_code}) - timeline kept locally", 'warning')
+            self.upload_supported = False
+            return None
+        if get_api_client().handle_auth_errors(response, self.auth_manager):
+            return None
+        if response.status_code not in [200, 201]:
+            log_activity(f"Activity upload failed: HTTP {response.status_code}", 'warning')
+            return None
+
+        log_activity(f"Uploaded {len(events)} activity event(s)")
+        self._drop_uploaded(count, period_end)
+        return count
+
+    def _trim_backlog(self):
+        """Drop the oldest events beyond ACTIVITY_MAX_PENDING_EVENTS while uploads aren't getting through"""
+        if not self.upload_lock.acquire(blocking=False):
+            return  # An upload is counting on the current positions
+        try:
+            with self.lock:
+                excess = len(self.timestamps) - ACTIVITY_MAX_PENDING_EVENTS
+                if excess <= 0:
+                    return
+                for column in (self.timestamps, self.app_ids, self.title_ids, self.domain_ids):
+                    del column[:excess]
+            log_activity(f"Activity backlog over {ACTIVITY_MAX_PENDING_EVENTS} events - dropped {excess} oldest", 'warning')
+            self._rewrite_log()
+        finally:
+            self.upload_lock.release()
+
+    def _drop_uploaded(self, count, period_end):
+        """Forget uploaded events, carrying the open segment over to the next batch"""
+        with self.lock:
+            carry = self.is_running and count == len(self.timestamps)
+            last = (self.app_ids[count - 1], self.title_ids[count - 1], self.domain_ids[count - 1])
+            for column in (self.timestamps, self.app_ids, self.title_ids, self.domain_ids):
+                del column[:count]
+            if carry:
+                # The current window is still focused - restart its segment now
+                self.timestamps.insert(0, period_end)
+                for column, value in zip((self.app_ids, self.title_ids, self.domain_ids), last):
+                    column.insert(0, value)
+        self._rewrite_log()
+
+    def _rewrite_log(self):
+        """Rewrite the log with only the events still pending and the strings they use"""
+        tmp_path = ACTIVITY_LOG_FILE + '.tmp'
+        with self.lock:
+            self._prune_strings()
+            with open(tmp_path, 'wb') as f:
+                for string_id, value in enumerate(self.strings[1:], 1):
+                    encoded = value.encode('utf-8')
+                    f.write(STRING_RECORD.pack(STRING_TYPE, string_id, len(encoded)) + encoded)
+                for i in range(len(self.timestamps)):
+                    f.write(EVENT_RECORD.pack(EVENT_TYPE, self.timestamps[i], self.app_ids[i],
+                                              self.title_ids[i], self.domain_ids[i]))
+            if self.log_file:
+                self.log_file.close()
+            os.replace(tmp_path, ACTIVITY_LOG_FILE)
+            if self.is_running:
+                self.log_file = open(ACTIVITY_LOG_FILE, 'ab')
+            else:
+                self.log_file = None
+
+    def _prune_strings(self):
+        """Keep only the strings pending events reference, renumbering them - caller holds the lock"""
+        columns = (self.app_ids, self.title_ids, self.domain_ids)
+        used = sorted({string_id for column in columns for string_id in column} - {AWAY_ID})
+        remap = {AWAY_ID: AWAY_ID}
+        strings = ['']
+        for old_id in used:
+            remap[old_id] = len(strings)
+            strings.append(self.strings[old_id])
+        for column in columns:
+            column[:] = array('I', (remap[string_id] for string_id in column))
+        self.strings = strings
+        self.string_ids = {value: string_id for string_id, value in enumerate(strings)}
+
+    def _load_log(self):
+        """Reload events left over from a previous session"""
+        if not os.path.exists(ACTIVITY_LOG_FILE):
+            return
+        try:
+            with open(ACTIVITY_LOG_FILE, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            record_type = data[offset]
+            if record_type == STRING_TYPE and offset + STRING_RECORD.size <= len(data):
+                _, string_id, length = STRING_RECORD.unpack_from(data, offset)
+                offset += STRING_RECORD.size
+                value = data[offset:offset + length].decode('utf-8', 'replace')
+                offset += length
+                while len(self.strings) <= string_id:
+                    self.strings.append('')
+                self.strings[string_id] = value
+                self.string_ids[value] = string_id
+            elif record_type == EVENT_TYPE and offset + EVENT_RECORD.size <= len(data):
+                _, timestamp, app_id, title_id, domain_id = EVENT_RECORD.unpack_from(data, offset)
+                offset += EVENT_RECORD.size
+                self._append_event(timestamp, app_id, title_id, domain_id)
+            else:
+                break  # Truncated tail from a crash
+
+        # The previous session ended without closing its last segment
+        if self.app_ids and self.app_ids[-1] != AWAY_ID:
+            closed_at = max(self.timestamps[-1], os.path.getmtime(ACTIVITY_LOG_FILE))
+            self._append_event(closed_at, AWAY_ID, AWAY_ID, AWAY_ID)
+        if self.timestamps:
+            log_activity(f"Loaded {len(self.timestamps)} pending activity event(s)")
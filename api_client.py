@@ -0,0 +1,176 @@
+# api_client.py - Shared pooled HTTP client for all API calls
+
+import re
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import API_BASE_URL, API_TIMEOUT, API_RETRIES, API_POOL_SIZE
+from connectivity import get_connectivity_monitor
+
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{16,}|[0-9a-f-]{36})$')
+# 403 error codes about the account itself - any other 403 is a per-resource refusal
+ACCESS_ERROR_CODES = ('SUBSCRIPTION_EXPIRED', 'SUBSCRIPTION_NONE', 'USER_INACTIVE', 'COMPANY_INACTIVE',
+                      'NO_EMPLOYEE_PROFILE', 'ACCESS_DENIED')
+ENDPOINT_UNSUPPORTED_STATUSES = (404, 405, 501)  # Older servers without an optional endpoint (bundles, preflight, ...)
+
+
+class NotAuthenticated(requests.exceptions.RequestException):
+    """No valid token - raised before anything is sent"""
+
+    def __init__(self, message="Not authenticated"):
+        super().__init__(message)
+
+
+class ApiClient:
+    """One keep-alive Session with auth injection, retries, 401/403 dispatch and latency metrics"""
+
+    def __init__(self, pool_size=API_POOL_SIZE, retries=API_RETRIES):
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']),  # Safe to repeat
+            respect_retry_after_header=False,  # A server's Retry-After could block the caller (even the UI) for minutes
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.connectivity = get_connectivity_monitor()
+        self.on_access_denied = None  # Callback(error_code, message) on any 401/403
+        self.denied = None  # (error_code, message) last notified - repeats from other threads are dropped
+        self.denied_lock = threading.Lock()
+        self.metrics = {}  # endpoint -> {'count', 'errors', 'total_ms', 'max_ms'}
+        self.metrics_lock = threading.Lock()
+
+    def request(self, method, url, auth=None, handle_denied=True, timeout=API_TIMEOUT, **kwargs):
+        """Send a request - `auth` is the AuthManager whose token to attach
+
+        Raises NotAuthenticated if auth is given but has no valid token. With
+        handle_denied, 401/403 responses are dispatched before returning.
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        if auth is not None and 'Authorization' not in headers:
+            auth_header = auth.get_auth_header()
+            if not auth_header:
+                raise NotAuthenticated()
+            headers.update(auth_header)
+        prepared = self.session.prepare_request(requests.Request(method, url, headers=headers, **kwargs))
+        response = self.send(prepared, timeout=timeout)
+        if auth is not None and handle_denied:
+            self.handle_auth_errors(response, auth)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def send(self, prepared, timeout=API_TIMEOUT):
+        """Send a prepared request, recording latency and connectivity"""
+        settings = self.session.merge_environment_settings(prepared.url, {}, None, None, None)
+        started = time.monotonic()
+        try:
+            response = self.session.send(prepared, timeout=timeout, **settings)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self._record(prepared.url, started, error=True)
+            self.connectivity.record_error(e)
+            raise
+        self._record(prepared.url, started, error=response.status_code >= 500)
+        self.connectivity.record_response(response)
+        return response
+
+    def handle_auth_errors(self, response, auth):
+        """Update auth state and notify on 401 or an account-level 403 - returns True if the response was one"""
+        if response.status_code == 401:
+            message = 'Session expired. Please login again.'
+            auth.update_access_from_error('TOKEN_EXPIRED', message)
+            self._notify('TOKEN_EXPIRED', message)
+            return True
+        if self.is_access_denial(response):
+            error_code, message = auth.handle_access_denied(response.json())
+            self._notify(error_code, message)
+            return True
+        if self.denied and response.status_code < 400:
+            with self.denied_lock:
+                self.denied = None  # Authorized again - the next denial is news
+        return False
+
+    def is_access_denial(self, response):
+        """Whether a response is a 403 about the subscription or account, not one resource"""
+        if response.status_code != 403:
+            return False
+        try:
+            data = response.json()
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get('error_code') in ACCESS_ERROR_CODES
+
+    def _notify(self, error_code, message):
+        """Call on_access_denied once per denial, however many threads hit it"""
+        with self.denied_lock:
+            if self.denied == (error_code, message):
+                return
+            self.denied = (error_code, message)
+        if self.on_access_denied:
+            self.on_access_denied(error_code, message)
+
+    def _record(self, url, started, error=False):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        endpoint = endpoint_name(url)
+        with self.metrics_lock:
+            stats = self.metrics.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def get_metrics(self):
+        """Per-endpoint call counts, errors and latency (ms)"""
+        with self.metrics_lock:
+            return {
+                endpoint: {
+                    'count': s['count'],
+                    'errors': s['errors'],
+                    'avg_ms': round(s['total_ms'] / s['count'], 1),
+                    'max_ms': round(s['max_ms'], 1)
+                }
+                for endpoint, s in self.metrics.items()
+            }
+
+
+def endpoint_name(url):
+    """'https://host/api/tasks/42/toggle/' -> '/tasks/{id}/toggle/'"""
+    path = urlsplit(url).path
+    base = urlsplit(API_BASE_URL).path
+    if base and path.startswith(base):
+        path = path[len(base):]
+    segments = ['{id}' if ID_SEGMENT.match(part) else part for part in path.split('/')]
+    return '/'.join(segments) or '/'
+
+
+# Singleton instance
+_api_client = None
+_api_client_lock = threading.Lock()
+
+def get_api_client():
+    """Get or create the shared API client"""
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = ApiClient()
+    return _api_client
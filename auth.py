@@ -1,17 +1,30 @@
 # auth.py - JWT Authentication Manager
 
-import json
-import os
+import time
+import threading
 import requests
-from datetime import datetime, timedelta
+from concurrent.futures import Future
 import jwt
-from config import AUTH_TOKEN_FILE, API_TOKEN_URL, API_TOKEN_REFRESH_URL, API_ACCESS_CHECK_URL
+from config import (
+    AUTH_TOKEN_FILE, PROFILE_INFO_FILE, API_TOKEN_URL, API_TOKEN_REFRESH_URL, API_ACCESS_CHECK_URL,
+    TOKEN_REFRESH_SKEW
+)
+from api_client import get_api_client, NotAuthenticated
+from state_store import get_state_file
+
+BACKGROUND_REFRESH_RETRY = 15  # seconds between background refresh attempts after a failure
 
 
 class AuthManager:
     def __init__(self):
         self.access_token = None
+        self.token_expiry = 0  # JWT 'exp' (epoch seconds), parsed once per token
+        self.header_cache = None  # (header, refresh_at, expires_at) - replaced whole, read without a lock
         self.refresh_token = None
+        self.refresh_lock = threading.Lock()
+        self.refresh_future = None  # In-flight refresh shared by concurrent callers
+        self.session_generation = 0  # Bumped on logout - refreshes started before it are discarded
+        self.next_background_refresh = 0
         # Subscription & Access Info
         self.access_granted = False
         self.error_code = None
@@ -21,26 +34,23 @@ class AuthManager:
         self.subscription_info = None
         self.access_message = None
         self.access_message_en = None
+        self.api = get_api_client()
+        self.token_state = get_state_file(AUTH_TOKEN_FILE)  # Shared in-memory copy, saved in the background
         self.load_tokens()
 
     def load_tokens(self):
         """Load tokens from local storage"""
-        if os.path.exists(AUTH_TOKEN_FILE):
-            try:
-                with open(AUTH_TOKEN_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.access_token = data.get('access')
-                    self.refresh_token = data.get('refresh')
-                    # Load cached access info
-                    self.access_granted = data.get('access_granted', False)
-                    self.error_code = data.get('error_code')
-                    self.user_info = data.get('user')
-                    self.employee_info = data.get('employee')
-                    self.company_info = data.get('company')
-                    self.subscription_info = data.get('subscription')
-            except (json.JSONDecodeError, IOError):
-                self.access_token = None
-                self.refresh_token = None
+        data = self.token_state.get()
+        if isinstance(data, dict):
+            self._set_access_token(data.get('access'))
+            self.refresh_token = data.get('refresh')
+            # Load cached access info
+            self.access_granted = data.get('access_granted', False)
+            self.error_code = data.get('error_code')
+            self.user_info = data.get('user')
+            self.employee_info = data.get('employee')
+            self.company_info = data.get('company')
+            self.subscription_info = data.get('subscription')
 
     def save_tokens(self, extra_data=None):
         """Save tokens to local storage"""
@@ -56,20 +66,20 @@ class AuthManager:
         }
         if extra_data:
             data.update(extra_data)
-        with open(AUTH_TOKEN_FILE, 'w') as f:
-            json.dump(data, f)
+        self.token_state.set(data)
 
     def login(self, username, password):
         """Login and get JWT tokens with access check"""
         try:
-            response = requests.post(API_TOKEN_URL, json={
+            response = self.api.post(API_TOKEN_URL, json={
                 'username': username,
                 'password': password
-            }, timeout=10)
+            })
             
             if response.status_code == 200:
                 data = response.json()
-                self.access_token = data.get('access')
+                self._new_session()
+                self._set_access_token(data.get('access'))
                 self.refresh_token = data.get('refresh')
                 
                 # Store access info from login response
@@ -104,12 +114,9 @@ class AuthManager:
 
     def check_access(self):
         """Check subscription and access status"""
-        headers = self.get_auth_header()
-        if not headers:
-            return False, "Not authenticated", None
-        
         try:
-            response = requests.get(API_ACCESS_CHECK_URL, headers=headers, timeout=10)
+            # The access check reports denial in its body - no 401/403 dispatch
+            response = self.api.get(API_ACCESS_CHECK_URL, auth=self, handle_denied=False)
             data = response.json()
             
             # Update stored info
@@ -141,44 +148,82 @@ class AuthManager:
         return 0
 
     def refresh_access_token(self):
-        """Refresh the access token using refresh token"""
-        if not self.refresh_token:
+        """Refresh the access token - concurrent callers share one in-flight request"""
+        with self.refresh_lock:
+            future = self.refresh_future
+            owner = future is None
+            if owner:
+                future = self.refresh_future = Future()
+        if not owner:
+            return future.result()
+        result = False
+        try:
+            result = self._request_refresh()
+        finally:
+            with self.refresh_lock:
+                if self.refresh_future is future:
+                    self.refresh_future = None
+            future.set_result(result)
+        return result
+
+    def _request_refresh(self):
+        """POST the refresh token - returns True if a new access token was stored"""
+        generation, refresh_token = self.session_generation, self.refresh_token
+        if not refresh_token:
             return False
         
         try:
-            response = requests.post(API_TOKEN_REFRESH_URL, json={
-                'refresh': self.refresh_token
-            }, timeout=10)
+            response = self.api.post(API_TOKEN_REFRESH_URL, json={
+                'refresh': refresh_token
+            })
             
-            if response.status_code == 200:
-                data = response.json()
-                self.access_token = data.get('access')
-                self.save_tokens()
-                return True
-            elif response.status_code == 401:
-                # Refresh token also expired or invalid
-                print("Refresh token expired or invalid")
-                self.access_granted = False
-                self.error_code = 'TOKEN_EXPIRED'
-                self.access_message = 'Session expired. Please login again.'
-                self.save_tokens()
+            with self.refresh_lock:
+                if generation != self.session_generation:
+                    return False  # Logged out meanwhile - don't bring the old session back
+                if response.status_code == 200:
+                    data = response.json()
+                    self._set_access_token(data.get('access'))
+                    if data.get('refresh'):
+                        self.refresh_token = data['refresh']  # Rotated refresh token
+                    self.save_tokens()
+                    return True
+                if response.status_code == 401:
+                    # Refresh token also expired or invalid
+                    print("Refresh token expired or invalid")
+                    self.access_granted = False
+                    self.error_code = 'TOKEN_EXPIRED'
+                    self.access_message = 'Session expired. Please login again.'
+                    self.save_tokens()
             return False
         except Exception as e:
             print(f"Token refresh error: {e}")
             return False
 
-    def is_token_expired(self):
-        """Check if access token is expired"""
-        if not self.access_token:
-            return True
-        
+    def _set_access_token(self, token):
+        """Store a new access token with its expiry and ready-made header"""
+        expiry = self._token_expiry(token)
+        self.access_token = token
+        self.token_expiry = expiry
+        if token and expiry:
+            header = {'Authorization': f'Bearer {token}'}
+            self.header_cache = (header, expiry - TOKEN_REFRESH_SKEW, expiry)
+        else:
+            self.header_cache = None
+
+    def _token_expiry(self, token):
+        """Epoch seconds the token expires at - 0 if missing or undecodable"""
+        if not token:
+            return 0
         try:
             # Decode without verification to check expiry
-            decoded = jwt.decode(self.access_token, options={"verify_signature": False})
-            exp = datetime.fromtimestamp(decoded['exp'])
-            return datetime.now() >= exp
-        except:
-            return True
+            decoded = jwt.decode(token, options={"verify_signature": False})
+            return float(decoded['exp'])
+        except Exception:
+            return 0
+
+    def is_token_expired(self):
+        """Check if access token is expired"""
+        return not self.access_token or time.time() >= self.token_expiry
 
     def get_valid_token(self):
         """Get a valid access token, refreshing if necessary"""
@@ -188,15 +233,41 @@ class AuthManager:
         return self.access_token
 
     def get_auth_header(self):
-        """Get authorization header for API requests"""
+        """Get authorization header for API requests
+
+        Lock-free while the token is fresh; inside the skew margin the current
+        header is still returned while a refresh runs in the background.
+        """
+        cached = self.header_cache
+        now = time.time()
+        if cached and now < cached[1]:
+            return dict(cached[0])
+        if cached and now < cached[2]:
+            self._refresh_in_background()
+            return dict(cached[0])
         token = self.get_valid_token()
         if token:
             return {'Authorization': f'Bearer {token}'}
         return None
 
+    def _refresh_in_background(self):
+        """Start a refresh ahead of expiry unless one is running or recently failed"""
+        now = time.time()
+        if self.refresh_future is not None or now < self.next_background_refresh:
+            return
+        self.next_background_refresh = now + BACKGROUND_REFRESH_RETRY
+        threading.Thread(target=self.refresh_access_token, daemon=True, name='token-refresh').start()
+
+    def _new_session(self):
+        """Start a new token generation - a refresh still in flight belongs to the old one"""
+        with self.refresh_lock:
+            self.session_generation += 1
+            self.refresh_future = None
+
     def logout(self):
         """Clear all tokens and access info"""
-        self.access_token = None
+        self._new_session()
+        self._set_access_token(None)
         self.refresh_token = None
         self.access_granted = False
         self.error_code = None
@@ -204,8 +275,7 @@ class AuthManager:
         self.employee_info = None
         self.company_info = None
         self.subscription_info = None
-        if os.path.exists(AUTH_TOKEN_FILE):
-            os.remove(AUTH_TOKEN_FILE)
+        self.token_state.delete()
 
     def is_logged_in(self):
         """Check if user is logged in with valid tokens"""
@@ -263,18 +333,13 @@ class AuthManager:
 
     def get_user_profile(self):
         """Get user profile data"""
-        headers = self.get_auth_header()
-        if not headers:
-            print("No auth header available")
-            return False, None
-        
         try:
             from config import API_BASE_URL
             # API_BASE_URL already includes /api, so just add /user/profile/
             url = f"{API_BASE_URL}/user/profile/"
             print(f"Fetching profile from: {url}")
             
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.api.get(url, auth=self)
             print(f"Profile response status: {response.status_code}")
             
             if response.status_code == 200:
@@ -290,6 +355,9 @@ class AuthManager:
                 print(f"Profile fetch failed: {response.status_code}")
                 print(f"Response: {response.text[:200]}")
                 return False, None
+        except NotAuthenticated:
+            print("No auth header available")
+            return False, None
         except requests.exceptions.ConnectionError as e:
             print(f"Connection error: {e}")
             return False, None
@@ -301,21 +369,16 @@ class AuthManager:
 
     def update_user_profile(self, email, first_name, last_name):
         """Update user profile"""
-        headers = self.get_auth_header()
-        if not headers:
-            return False, "Not authenticated"
-        
         try:
             from config import API_BASE_URL
-            response = requests.put(
+            response = self.api.put(
                 f"{API_BASE_URL}/user/profile/",
-                headers=headers,
+                auth=self,
                 json={
                     'email': email,
                     'first_name': first_name,
                     'last_name': last_name
-                },
-                timeout=10
+                }
             )
             
             if response.status_code == 200:
@@ -335,20 +398,15 @@ class AuthManager:
 
     def change_password(self, current_password, new_password):
         """Change user password"""
-        headers = self.get_auth_header()
-        if not headers:
-            return False, "Not authenticated"
-        
         try:
             from config import API_BASE_URL
-            response = requests.post(
+            response = self.api.post(
                 f"{API_BASE_URL}/user/change-password/",
-                headers=headers,
+                auth=self,
                 json={
                     'current_password': current_password,
                     'new_password': new_password
-                },
-                timeout=10
+                }
             )
             
             if response.status_code == 200:
@@ -362,11 +420,6 @@ class AuthManager:
 
     def upload_profile_photo(self, file_path):
         """Upload profile photo"""
-        headers = self.get_auth_header()
-        if not headers:
-            print("No auth header for photo upload")
-            return False, "Not authenticated"
-        
         try:
             from config import API_BASE_URL
             url = f"{API_BASE_URL}/user/upload-photo/"
@@ -376,9 +429,9 @@ class AuthManager:
             with open(file_path, 'rb') as f:
                 files = {'profile_photo': f}
                 print(f"Sending file...")
-                response = requests.post(
+                response = self.api.post(
                     url,
-                    headers=headers,
+                    auth=self,
                     files=files,
                     timeout=30
                 )
@@ -405,6 +458,9 @@ class AuthManager:
                     return False, data.get('error', 'Failed to upload photo')
                 except:
                     return False, f"Upload failed with status {response.status_code}"
+        except NotAuthenticated as e:
+            print("No auth header for photo upload")
+            return False, str(e)
         except FileNotFoundError:
             print(f"File not found: {file_path}")
             return False, "File not found"
@@ -416,8 +472,6 @@ class AuthManager:
 
     def save_profile_info(self, user_info):
         """Save profile info to config file"""
-        from config import PROFILE_INFO_FILE
-        
         try:
             if user_info:
                 data = {
@@ -428,30 +482,17 @@ class AuthManager:
                     'last_name': user_info.get('last_name', ''),
                     'full_name': user_info.get('full_name', '')
                 }
-                with open(PROFILE_INFO_FILE, 'w') as f:
-                    json.dump(data, f)
+                get_state_file(PROFILE_INFO_FILE).set(data)
                 print("Profile info saved")
         except Exception as e:
             print(f"Error saving profile info: {e}")
     
     def load_profile_info(self):
         """Load profile info from config file"""
-        from config import PROFILE_INFO_FILE
-        
-        try:
-            if os.path.exists(PROFILE_INFO_FILE):
-                with open(PROFILE_INFO_FILE, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Error loading profile info: {e}")
-        return None
+        return get_state_file(PROFILE_INFO_FILE).get()
 
     def update_user_profile(self, email, first_name, last_name):
         """Update user profile information"""
-        headers = self.get_auth_header()
-        if not headers:
-            return False, "Not authenticated"
-        
         try:
             from config import API_BASE_URL
             url = f"{API_BASE_URL}/user/profile/"
@@ -462,7 +503,7 @@ class AuthManager:
                 'last_name': last_name
             }
             
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
+            response = self.api.patch(url, auth=self, json=data)
             
             if response.status_code == 200:
                 profile_data = response.json()
@@ -483,6 +524,8 @@ class AuthManager:
                     return False, error_data.get('error', 'Failed to update profile')
                 except:
                     return False, f"Update failed with status {response.status_code}"
+        except NotAuthenticated as e:
+            return False, str(e)
         except requests.exceptions.ConnectionError:
             return False, "Cannot connect to server"
         except Exception as e:
@@ -493,10 +536,6 @@ class AuthManager:
     
     def change_password(self, current_password, new_password):
         """Change user password"""
-        headers = self.get_auth_header()
-        if not headers:
-            return False, "Not authenticated"
-        
         try:
             from config import API_BASE_URL
             url = f"{API_BASE_URL}/user/change-password/"
@@ -506,7 +545,7 @@ class AuthManager:
                 'new_password': new_password
             }
             
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = self.api.post(url, auth=self, json=data)
             
             if response.status_code == 200:
                 return True, "Password changed successfully"
@@ -516,6 +555,8 @@ class AuthManager:
                     return False, error_data.get('error', 'Failed to change password')
                 except:
                     return False, f"Change password failed with status {response.status_code}"
+        except NotAuthenticated as e:
+            return False, str(e)
         except requests.exceptions.ConnectionError:
             return False, "Cannot connect to server"
         except Exception as e:
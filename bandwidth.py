@@ -0,0 +1,176 @@
+# bandwidth.py - Upload bandwidth shaping (token bucket, schedule, latency throttle)
+
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlsplit
+import requests
+from config import (
+    API_BASE_URL, UPLOAD_BANDWIDTH_LIMIT, UPLOAD_BANDWIDTH_SCHEDULE, UPLOAD_BANDWIDTH_FLOOR,
+    UPLOAD_LATENCY_THROTTLE, UPLOAD_LATENCY_THROTTLE_FACTOR, UPLOAD_LATENCY_PROBE_INTERVAL,
+    UPLOAD_LATENCY_BASELINE_INTERVAL
+)
+from debug_logger import log_sync
+from api_client import get_api_client
+
+RATE_WINDOW = 10  # seconds of history behind current_rate()
+
+
+class TokenBucket:
+    """Byte budget refilled at `rate` bytes/s - a rate of 0 means unlimited"""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, float(rate))
+
+    def consume(self, amount, stop_event):
+        """Take `amount` bytes, waiting for the budget - returns False if stopped meanwhile
+
+        Requests larger than one second of budget are let through and paid back
+        as debt, so no single upload can stall forever.
+        """
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return True
+                self._refill()
+                if self.tokens >= 0:
+                    self.tokens -= amount
+                    return True
+                delay = -self.tokens / self.rate
+            if stop_event.wait(min(delay, 1.0)):
+                return False
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def scheduled_limit(schedule=UPLOAD_BANDWIDTH_SCHEDULE, default=UPLOAD_BANDWIDTH_LIMIT, now=None):
+    """Bytes/s cap for the current time of day - first matching ('HH:MM', 'HH:MM', rate) wins"""
+    current = (now or datetime.now()).strftime('%H:%M')
+    for start, end, rate in schedule:
+        if start <= end:
+            if start <= current < end:
+                return rate
+        elif current >= start or current < end:  # Window wraps past midnight
+            return rate
+    return default
+
+
+class BandwidthShaper:
+    """Pace upload bytes to the scheduled cap, backing off when latency under load rises"""
+
+    def __init__(self, probe_url=None, client=None):
+        parts = urlsplit(API_BASE_URL)
+        self.client = client  # Shared ApiClient for latency probes (default: get_api_client())
+        self.probe_url = probe_url or f"{parts.scheme}://{parts.netloc}/"
+        self.bucket = TokenBucket(scheduled_limit())
+        self.throttle_rate = None  # Latency-driven cap below the scheduled one
+        self.sent = deque()  # (time.monotonic(), bytes) over the last RATE_WINDOW seconds
+        self.rtts = deque(maxlen=30)  # Samples taken while uploading
+        self.baseline_rtts = deque(maxlen=10)  # Samples taken while idle - the unloaded round trip
+        self.last_send = 0.0
+        self.lock = threading.Lock()
+        self.stop_event = None  # Per run of the latency loop - an old loop keeps its own, already set
+
+    def start(self):
+        if UPLOAD_LATENCY_THROTTLE and not self.stop_event:
+            self.stop_event = threading.Event()
+            threading.Thread(target=self._latency_loop, args=(self.stop_event,), daemon=True).start()
+
+    def stop(self):
+        """Signal the latency loop - it exits after its current probe, nobody waits for it"""
+        stop_event, self.stop_event = self.stop_event, None
+        if stop_event:
+            stop_event.set()
+
+    def consume(self, amount, stop_event):
+        """Wait until `amount` upload bytes may be sent"""
+        self._apply_limit()
+        if not self.bucket.consume(amount, stop_event):
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.sent.append((now, amount))
+            self.last_send = now
+        return True
+
+    def current_rate(self):
+        """Upload bytes/s over the last RATE_WINDOW seconds"""
+        now = time.monotonic()
+        with self.lock:
+            while self.sent and self.sent[0][0] < now - RATE_WINDOW:
+                self.sent.popleft()
+            return sum(amount for _, amount in self.sent) / RATE_WINDOW
+
+    def current_limit(self):
+        """Effective bytes/s cap (0 = unlimited)"""
+        return self.bucket.rate
+
+    def _apply_limit(self):
+        limit = scheduled_limit()
+        if self.throttle_rate:
+            limit = min(limit, self.throttle_rate) if limit else self.throttle_rate
+        if limit != self.bucket.rate:
+            self.bucket.set_rate(limit)
+
+    def record_rtt(self, rtt, idle=False):
+        """Feed a round-trip sample - idle ones set the baseline, loaded ones adjust the throttle"""
+        with self.lock:
+            if idle:
+                self.baseline_rtts.append(rtt)
+                self.rtts.clear()  # The next upload burst is judged on its own samples
+                return
+            self.rtts.append(rtt)
+            if not self.baseline_rtts or len(self.rtts) < 3:
+                return
+            baseline = min(self.baseline_rtts)
+            recent = sorted(list(self.rtts)[-3:])[1]  # Median of the last three
+        loaded = recent > baseline * UPLOAD_LATENCY_THROTTLE_FACTOR and recent - baseline > 0.05
+        if loaded:
+            # Multiplicative decrease from what we're actually sending
+            base = self.throttle_rate or self.current_rate() or UPLOAD_BANDWIDTH_FLOOR
+            rate = max(UPLOAD_BANDWIDTH_FLOOR, int(base * 0.7))
+            if rate != self.throttle_rate:
+                log_sync(f"Upload latency {recent * 1000:.0f} ms (baseline {baseline * 1000:.0f} ms) - "
+                         f"throttling to {rate // 1024} KB/s", 'warning')
+            self.throttle_rate = rate
+        elif self.throttle_rate:
+            # Recover gradually; drop the throttle once above the scheduled cap
+            self.throttle_rate = int(self.throttle_rate * 1.1)
+            limit = scheduled_limit()
+            if limit and self.throttle_rate >= limit:
+                self.throttle_rate = None
+        self._apply_limit()
+
+    def _latency_loop(self, stop_event):
+        """Measure round trips to our API host - now and then while idle, often while uploading"""
+        client = self.client or get_api_client()  # Pooled connection, counted in connectivity
+        next_baseline = 0.0
+        while not stop_event.is_set():
+            now = time.monotonic()
+            idle = now - self.last_send > UPLOAD_LATENCY_PROBE_INTERVAL * 2
+            if idle and self.throttle_rate:
+                self.throttle_rate = None  # Start fresh next time
+            if not idle or now >= next_baseline:
+                if idle:
+                    next_baseline = now + UPLOAD_LATENCY_BASELINE_INTERVAL
+                try:
+                    started = time.monotonic()
+                    client.request('HEAD', self.probe_url, timeout=10)
+                    self.record_rtt(time.monotonic() - started, idle=idle)
+                except requests.exceptions.RequestException:
+                    pass
+            stop_event.wait(UPLOAD_LATENCY_PROBE_INTERVAL)
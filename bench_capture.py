@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the capture -> encoder frame handoff
+Usage: python bench_capture.py [width height]
+
+Each case runs in a fresh process and reports its peak RSS growth - Pillow's
+C buffers and shared memory mappings never show up in tracemalloc.
+"""
+
+import os
+import sys
+import time
+import pickle
+import multiprocessing
+from multiprocessing import shared_memory
+from PIL import Image
+from mss.screenshot import ScreenShot
+
+try:
+    import resource  # Unix
+except ImportError:
+    resource = None
+import psutil
+
+
+def peak_rss():
+    """Highest resident set size of this process so far, in bytes"""
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KB
+    return psutil.Process().memory_info().peak_wset
+
+
+def old_convert(raw, size, monitor):
+    Image.frombytes("RGB", size, ScreenShot(raw, monitor).rgb)
+
+
+def new_convert(raw, size, monitor):
+    Image.frombytes("RGB", size, memoryview(raw), "raw", "BGRX")
+
+
+def pickle_handoff(raw, size, monitor):
+    pickle.loads(pickle.dumps(raw))
+
+
+def shared_handoff(raw, size, monitor):
+    shm = shared_memory.SharedMemory(create=True, size=len(raw))
+    shm.buf[:len(raw)] = raw
+    shm.close()
+    shm.unlink()
+
+
+CASES = [
+    ("Pillow conversion:", [
+        ("frombytes(shot.rgb)  [old]", old_convert),
+        ("frombytes(shot.raw, BGRX)  [new]", new_convert),
+    ]),
+    ("Handoff to encoder process:", [
+        ("pickle round trip  [old]", pickle_handoff),
+        ("shared memory copy  [new]", shared_handoff),
+    ]),
+]
+
+
+def run_case(func, width, height, rounds, results):
+    """Child process: time func and report how far it pushed RSS above the baseline"""
+    monitor = {'left': 0, 'top': 0, 'width': width, 'height': height}
+    raw = bytearray(os.urandom(width * height * 4))
+    baseline = psutil.Process().memory_info().rss
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(raw, (width, height), monitor)
+    elapsed = (time.perf_counter() - started) / rounds
+    results.put((elapsed, max(0, peak_rss() - baseline)))
+
+
+def measure(label, func, width, height, rounds=5):
+    """Run func in a fresh process and print average time and peak RSS growth"""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=run_case, args=(func, width, height, rounds, results))
+    process.start()
+    elapsed, peak = results.get()
+    process.join()
+    print(f"{label:<40} {elapsed * 1000:8.1f} ms   peak RSS +{peak / (1024 * 1024):7.1f} MB")
+
+
+def main():
+    width, height = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) == 3 else (3840, 2160)
+    print(f"Frame: {width}x{height} ({width * height * 4 / (1024 * 1024):.1f} MB BGRA)")
+    for title, cases in CASES:
+        print(f"\n{title}")
+        for label, func in cases:
+            measure(label, func, width, height)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the upload queue / sync manager
+Usage: python bench_sync.py scan [counts...]
+       python bench_sync.py upload [files] [latency_ms]
+       python bench_sync.py resumable [files] [size_mb] [drop_rate]
+       python bench_sync.py reconcile [pending] [history...]
+       python bench_sync.py api [calls]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+import requests
+import sync_manager
+import task_manager
+import chat_api
+from api_client import get_api_client
+from queue_store import QueueStore
+from upload_engine import UploadEngine
+from devserver import StandInServer
+
+
+class NoAuth:
+    """Stand-in auth manager - benchmarks never hit the real API"""
+
+    def get_auth_header(self):
+        return None
+
+
+class BenchAuth:
+    """Stand-in auth manager for the local stand-in server"""
+
+    def get_auth_header(self):
+        return {'Authorization': 'Bearer bench'}
+
+
+def bench_scan(counts):
+    """Time scan_local_files over a screenshots folder of N files"""
+    for count in counts:
+        workdir = tempfile.mkdtemp(prefix='bench_scan_')
+        try:
+            screenshots = os.path.join(workdir, 'screenshots')
+            per_folder = 500
+            for idx in range(count):
+                folder = os.path.join(screenshots, '2024-01-01', f'screen{idx // per_folder + 1}')
+                if idx % per_folder == 0:
+                    os.makedirs(folder, exist_ok=True)
+                open(os.path.join(folder, f'{idx:06d}.webp'), 'wb').close()
+
+            sync_manager.SCREENSHOTS_DIR = screenshots
+            store = QueueStore(os.path.join(workdir, 'queue.db'), legacy_json=None)
+            manager = sync_manager.SyncManager(NoAuth(), store=store)
+
+            started = time.perf_counter()
+            manager.scan_local_files()
+            first = time.perf_counter() - started
+
+            started = time.perf_counter()
+            manager.scan_local_files()  # Everything already queued
+            again = time.perf_counter() - started
+
+            print(f"{count:>8} files   first scan {first:7.2f} s   rescan {again:7.2f} s   "
+                  f"queued {manager.get_queue_count()}")
+            store.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_upload(count, latency_ms):
+    """Drain a queue of N small files against the local stand-in server"""
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    try:
+        screenshots = os.path.join(workdir, 'screenshots')
+        folder = os.path.join(screenshots, '2024-01-01', 'screen1')
+        os.makedirs(folder)
+        payload = os.urandom(100 * 1024)
+        for idx in range(count):
+            with open(os.path.join(folder, f'{idx:06d}.webp'), 'wb') as f:
+                f.write(payload)
+        sync_manager.SCREENSHOTS_DIR = screenshots
+
+        runs = [('per-file requests.post (old)', None, False), ('engine, 1 worker', 1, False),
+                ('engine, 4 workers', 4, False), ('engine, 8 workers', 8, False),
+                ('engine, 1 worker, bundles', 1, True), ('engine, 4 workers, bundles', 4, True)]
+        for run, (label, workers, bundles) in enumerate(runs):
+            server = StandInServer(latency=latency_ms / 1000).start()
+            sync_manager.API_SCREENSHOT_UPLOAD_URL = server.base_url + '/upload/'
+            sync_manager.API_SCREENSHOT_BUNDLE_URL = server.base_url + '/upload-bundle/'
+            store = QueueStore(os.path.join(workdir, f'queue_{run}.db'), legacy_json=None)
+            manager = sync_manager.SyncManager(BenchAuth(), store=store)
+            if workers is None:
+                # Old behaviour minus its fixed sleeps: sequential, new connection per file
+                manager.engine = UploadEngine(workers=1)
+                manager.engine.post = lambda url, priority=False, **kwargs: requests.post(url, **kwargs)
+            else:
+                manager.engine = UploadEngine(workers=workers, per_host_limit=workers)
+            manager.bundle_enabled = bundles
+            manager.dedup_enabled = False  # Every file has the same bytes - measure transport only
+            manager.scan_local_files()
+            manager.engine.start()
+
+            started = time.perf_counter()
+            while manager.upload_queue:
+                if not manager._process_queue_batch():
+                    break
+            elapsed = time.perf_counter() - started
+            manager.engine.stop()
+
+            print(f"{label:<30} {count / elapsed:7.1f} files/s   "
+                  f"connections {server.connections:>4}   requests {server.requests:>4}   "
+                  f"uploaded {server.uploads}")
+            store.close()
+            server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_resumable(count, size_mb, drop_rate):
+    """Upload large files over a link that drops, single POST vs resumable chunks"""
+    workdir = tempfile.mkdtemp(prefix='bench_resumable_')
+    try:
+        screenshots = os.path.join(workdir, 'screenshots')
+        folder = os.path.join(screenshots, '2024-01-01', 'screen1')
+        os.makedirs(folder)
+        for idx in range(count):
+            with open(os.path.join(folder, f'{idx:06d}.webp'), 'wb') as f:
+                f.write(os.urandom(int(size_mb * 1024 * 1024)))
+        sync_manager.SCREENSHOTS_DIR = screenshots
+        sync_manager.UPLOAD_RETRY_BASE_DELAY = 0  # Retry dropped files right away
+        sync_manager.UPLOAD_MAX_ATTEMPTS = 1000
+        total = count * int(size_mb * 1024 * 1024)
+
+        for run, (label, resumable) in enumerate([('single POST', False), ('resumable chunks', True)]):
+            server = StandInServer(drop_rate=drop_rate).start()
+            sync_manager.API_SCREENSHOT_UPLOAD_URL = server.base_url + '/upload/'
+            sync_manager.API_UPLOAD_SESSIONS_URL = server.base_url + '/upload-sessions/'
+            store = QueueStore(os.path.join(workdir, f'queue_{run}.db'), legacy_json=None)
+            manager = sync_manager.SyncManager(BenchAuth(), store=store)
+            manager.resumable_enabled = resumable
+            manager.dedup_enabled = False
+            manager.scan_local_files()
+            manager.engine.start()
+
+            started = time.perf_counter()
+            rounds = 0
+            while manager.upload_queue and rounds < 50:
+                manager._process_queue_batch()
+                rounds += 1
+            elapsed = time.perf_counter() - started
+            manager.engine.stop()
+
+            print(f"{label:<18} uploaded {server.uploads}/{count} in {rounds:>2} round(s) {elapsed:6.2f} s   "
+                  f"sent {server.bytes_received / total:5.2f}x file bytes   drops {server.dropped}")
+            store.close()
+            server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_reconcile(pending, histories):
+    """Bytes the server returns to reconcile `pending` files, full list vs digest check"""
+    workdir = tempfile.mkdtemp(prefix='bench_reconcile_')
+    try:
+        screenshots = os.path.join(workdir, 'screenshots')
+        sync_manager.SCREENSHOTS_DIR = screenshots
+        items = [{'file_path': os.path.join(screenshots, '2024-01-02', 'screen1', f'{idx:06d}.webp'), 'url_data': {}}
+                 for idx in range(pending)]
+        for history in histories:
+            # Half the pending files are already on the server (e.g. uploaded before a crash)
+            known = [os.path.join('2024-01-01', 'screen1', f'{idx:07d}.webp') for idx in range(history)]
+            known += [os.path.relpath(item['file_path'], screenshots) for item in items[::2]]
+            for run, (label, incremental) in enumerate([('full uploaded_paths', False), ('digest check', True)]):
+                server = StandInServer(known_paths=known, sync_check=incremental).start()
+                sync_manager.API_SYNC_STATUS_URL = server.base_url + '/sync-status/'
+                sync_manager.API_SYNC_CHECK_URL = server.base_url + '/sync-status/check/'
+                store = QueueStore(os.path.join(workdir, f'queue_{history}_{run}.db'), legacy_json=None)
+                manager = sync_manager.SyncManager(BenchAuth(), store=store)
+                for item in items:
+                    manager.upload_queue.add(item)
+
+                started = time.perf_counter()
+                manager.sync_with_server()
+                elapsed = time.perf_counter() - started
+                print(f"history {history:>8}   {label:<20} {elapsed:6.2f} s   response {server.bytes_sent / 1024:9.1f} KB   "
+                      f"still pending {len(manager.upload_queue)}")
+                store.close()
+                server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_api(calls):
+    """UI/chat API calls over HTTPS - per-call requests.get vs the pooled API client"""
+    workdir = tempfile.mkdtemp(prefix='bench_api_')
+    try:
+        certfile, keyfile = os.path.join(workdir, 'cert.pem'), os.path.join(workdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                        '-keyout', keyfile, '-out', certfile], check=True, capture_output=True)
+        os.environ['REQUESTS_CA_BUNDLE'] = certfile  # Trust the stand-in (overrides Session.verify)
+        headers = BenchAuth().get_auth_header()
+        for label, pooled in [('requests.get per call (old)', False), ('shared API client', True)]:
+            server = StandInServer(tls=(certfile, keyfile)).start()
+            api_base = server.base_url + '/api'
+            task_manager.API_TASKS_URL = f"{api_base}/tasks/"
+            task_manager.API_BASE_URL = chat_api.API_BASE_URL = api_base
+            client = get_api_client()
+            tasks, chat = task_manager.TaskManager(BenchAuth()), chat_api.ChatAPI(BenchAuth())
+
+            started = time.perf_counter()
+            for idx in range(calls):
+                if pooled:
+                    (tasks.get_tasks, tasks.get_current_attendance, chat.get_unread_count)[idx % 3]()
+                else:
+                    url = (f"{api_base}/tasks/", f"{api_base}/attendance/current/", f"{api_base}/chat/unread/")[idx % 3]
+                    requests.get(url, headers=headers, timeout=10)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<28} {calls} calls   {elapsed:6.2f} s   {elapsed / calls * 1000:6.2f} ms/call   "
+                  f"TLS handshakes {server.connections}")
+            server.stop()
+            client.session.close()
+        for endpoint, stats in sorted(client.get_metrics().items()):
+            print(f"  {endpoint:<24} {stats}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('scan', 'upload', 'resumable', 'reconcile', 'api'):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == 'scan':
+        bench_scan([int(c) for c in sys.argv[2:]] or [1000, 10000, 100000])
+    elif sys.argv[1] == 'upload':
+        bench_upload(int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+                     float(sys.argv[3]) if len(sys.argv) > 3 else 20)
+    elif sys.argv[1] == 'resumable':
+        bench_resumable(int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+                        float(sys.argv[3]) if len(sys.argv) > 3 else 4,
+                        float(sys.argv[4]) if len(sys.argv) > 4 else 0.1)
+    elif sys.argv[1] == 'reconcile':
+        bench_reconcile(int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+                        [int(h) for h in sys.argv[3:]] or [10000, 100000, 1000000])
+    elif sys.argv[1] == 'api':
+        bench_api(int(sys.argv[2]) if len(sys.argv) > 2 else 300)
@@ -0,0 +1,91 @@
+# change_detector.py - Per-monitor change detection for screenshot frames
+
+import time
+from PIL import Image, ImageChops
+from config import (
+    CHANGE_THRESHOLD, CHANGE_PIXEL_TOLERANCE, CHANGE_SAMPLE_STEP, CHANGE_KEEPALIVE_SECONDS
+)
+
+# NumPy is optional - fall back to Pillow if it is not installed
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class ChangeDetector:
+    """Compare a downsampled copy of each frame against the last accepted one"""
+
+    def __init__(self, threshold=CHANGE_THRESHOLD, pixel_tolerance=CHANGE_PIXEL_TOLERANCE,
+                 sample_step=CHANGE_SAMPLE_STEP, keepalive=CHANGE_KEEPALIVE_SECONDS):
+        self.threshold = threshold
+        self.pixel_tolerance = pixel_tolerance
+        self.sample_step = max(1, int(sample_step))
+        self.keepalive = keepalive
+        self.last_frames = {}  # key -> (signature, accepted_at) of the last saved frame
+        self.pending = {}  # key -> (signature, checked_at) of a changed frame not yet saved
+
+    def check(self, key, raw, size):
+        """Check a BGRA frame buffer - returns (changed, change_ratio)
+
+        A changed frame only becomes the reference once commit() is called for
+        it; until then later frames are still compared with the last saved one.
+        """
+        signature = self._signature(raw, size)
+        now = time.monotonic()
+        previous = self.last_frames.get(key)
+
+        if previous is None or self._shape(previous[0]) != self._shape(signature):
+            self.pending[key] = (signature, now)
+            return True, 1.0
+
+        ratio = self._diff_ratio(previous[0], signature)
+        expired = self.keepalive and now - previous[1] >= self.keepalive
+        if ratio >= self.threshold or expired:
+            self.pending[key] = (signature, now)
+            return True, ratio
+        return False, ratio
+
+    def commit(self, key):
+        """The changed frame was saved - compare future frames against it"""
+        entry = self.pending.pop(key, None)
+        if entry is not None:
+            self.last_frames[key] = entry
+
+    def rollback(self, key):
+        """The changed frame was dropped or failed to encode - keep the old reference"""
+        self.pending.pop(key, None)
+
+    def forget(self, key):
+        """Drop the reference frame for a disconnected monitor"""
+        self.last_frames.pop(key, None)
+        self.pending.pop(key, None)
+
+    def _signature(self, raw, size):
+        """Build a small intensity map from the frame buffer"""
+        width, height = size
+        step = self.sample_step
+        if NUMPY_AVAILABLE:
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)
+            # Strided view - only the sampled pixels are touched
+            return frame[::step, ::step, :3].sum(axis=2, dtype=np.int32)
+
+        img = Image.frombuffer("RGB", size, bytes(raw), "raw", "BGRX", 0, 1)
+        small_size = (max(1, width // step), max(1, height // step))
+        return img.resize(small_size, Image.NEAREST).convert("L")
+
+    def _diff_ratio(self, old, new):
+        """Fraction of sampled pixels that differ by more than the tolerance"""
+        if NUMPY_AVAILABLE:
+            changed = np.count_nonzero(np.abs(new - old) > self.pixel_tolerance * 3)
+            return float(changed) / new.size
+
+        diff = ImageChops.difference(old, new)
+        changed = diff.point(lambda p: 255 if p > self.pixel_tolerance else 0).histogram()[255]
+        return changed / (new.size[0] * new.size[1])
+
+    def _shape(self, signature):
+        if NUMPY_AVAILABLE:
+            return signature.shape
+        return signature.size
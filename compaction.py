@@ -0,0 +1,161 @@
+# compaction.py - Thin and re-encode an old upload backlog
+
+import os
+import time
+from PIL import Image
+from config import (
+    SCREENSHOTS_DIR, IMAGE_FORMAT, IMAGE_MIN_QUALITY, UPLOAD_FRESH_WINDOW, COMPACTION_AGE,
+    COMPACTION_MAX_BYTES, COMPACTION_THIN_MINUTES, COMPACTION_QUALITY, COMPACTION_BYTE_BUDGET
+)
+from debug_logger import log_sync
+from encoding_policy import encode_to_budget
+from frame_delta import is_delta_file, load_manifest, manifest_path_for
+
+
+class BacklogCompactor:
+    """Keep one frame per screen per time window and shrink what's kept"""
+
+    def __init__(self, age=COMPACTION_AGE, max_bytes=COMPACTION_MAX_BYTES,
+                 thin_minutes=COMPACTION_THIN_MINUTES, quality=COMPACTION_QUALITY):
+        self.age = age
+        self.max_bytes = max_bytes
+        self.thin_minutes = thin_minutes
+        self.quality = quality
+
+    def compact(self, items, retrying=()):
+        """Compact eligible items - returns (updated, dropped) queue items
+
+        Updated items carry a 'compaction' record of what was done to them;
+        dropped items say which kept frame stands in for them. Paths in
+        `retrying` are backing off after a failure and are left alone.
+        """
+        cutoff = self._cutoff(items)
+        # Unchanged markers carry no file - nothing to thin or re-encode
+        timed = [(self._captured_at(item), item) for item in items
+                 if not item.get('unchanged') and item['file_path'] not in retrying]
+        # Items with no known capture time never enter the thinning buckets
+        eligible = sorted(
+            ((captured_at, item) for captured_at, item in timed if captured_at is not None and captured_at < cutoff),
+            key=lambda pair: pair[0]
+        )
+        if not eligible:
+            return [], []
+
+        # One frame per (screen folder, time window) - the earliest in each
+        window = self.thin_minutes * 60
+        buckets = {}
+        for captured_at, item in eligible:
+            key = (os.path.dirname(item['file_path']), int(captured_at // window))
+            buckets.setdefault(key, []).append(item)
+
+        keepers, drop = [], []
+        for members in buckets.values():
+            keepers.append(members[0])
+            drop.extend((item, members[0]) for item in members[1:])
+
+        # Deltas and unchanged markers need their reference - never drop or re-encode one still referenced
+        keyframes = self._referenced_keyframes(items)
+        rescued = [(item, 1) for item, _ in drop if item['file_path'] in keyframes]
+        drop = [(item, kept) for item, kept in drop if item['file_path'] not in keyframes]
+
+        # A keeper stands in only for the frames actually dropped, not the rescued ones
+        stands_in = {}
+        for _, kept in drop:
+            stands_in[kept['file_path']] = stands_in.get(kept['file_path'], 0) + 1
+        keep = [(item, 1 + stands_in.get(item['file_path'], 0)) for item in keepers]
+
+        updated = []
+        for item, represents in keep + rescued:
+            record = dict(item.get('compaction') or {})
+            if represents > 1:
+                record['thin_window_minutes'] = self.thin_minutes
+                record['represents'] = record.get('represents', 1) + represents - 1
+            if self.quality and 'reencoded' not in record and not is_delta_file(item['file_path']) \
+                    and item['file_path'] not in keyframes:
+                reencoded = self._reencode(item['file_path'])
+                if reencoded:
+                    record['reencoded'] = reencoded
+            if record != (item.get('compaction') or {}):
+                item = {**item, 'compaction': record}
+                if 'reencoded' in record:
+                    item.pop('sha256', None)  # Content changed - rehashed before upload
+                updated.append(item)
+
+        dropped = []
+        for item, kept in drop:
+            self._remove_file(item['file_path'])
+            dropped.append({**item, 'compaction': {'dropped': True, 'kept': kept['file_path'],
+                                                   'thin_window_minutes': self.thin_minutes}})
+
+        if updated or dropped:
+            log_sync(f"Backlog compaction: {len(dropped)} frame(s) thinned, "
+                     f"{sum('reencoded' in i['compaction'] for i in updated)} re-encoded")
+        return updated, dropped
+
+    def _captured_at(self, item):
+        """Capture time (epoch seconds) - file mtime for items queued without one, None if unknown"""
+        captured_at = item.get('captured_at')
+        if isinstance(captured_at, (int, float)):
+            return captured_at
+        try:
+            return os.path.getmtime(item['file_path'])
+        except OSError:
+            return None  # Missing file - unknown time
+
+    def _referenced_keyframes(self, items):
+        """Frames referenced by every pending delta or unchanged marker, kept or not"""
+        keyframes = set()
+        for item in items:
+            if item.get('unchanged'):
+                keyframes.add(item['reference_path'])
+            elif is_delta_file(item['file_path']):
+                manifest = load_manifest(item['file_path'])
+                if manifest:
+                    keyframes.add(os.path.join(SCREENSHOTS_DIR, manifest['keyframe']))
+        return keyframes
+
+    def _cutoff(self, items):
+        """Items captured before this time are compacted"""
+        now = time.time()
+        total = 0
+        for item in items:
+            try:
+                total += os.path.getsize(item['file_path'])
+            except OSError:
+                pass
+        if self.max_bytes and total > self.max_bytes:
+            return now - UPLOAD_FRESH_WINDOW  # Over the disk budget - everything but fresh frames
+        return now - self.age
+
+    def _reencode(self, file_path):
+        """Re-encode at compaction quality if that saves space - returns the record or None"""
+        try:
+            original = os.path.getsize(file_path)
+            with Image.open(file_path) as img:
+                img = img.convert("RGB")
+            plan = {
+                'quality': self.quality,
+                'min_quality': IMAGE_MIN_QUALITY,
+                'byte_budget': COMPACTION_BYTE_BUDGET,
+                'max_attempts': 2,
+                'method': 4
+            }
+            data, encoding = encode_to_budget(img, IMAGE_FORMAT, plan)
+            if len(data) >= original * 0.9:
+                return None  # Not worth a visible quality drop
+            tmp_path = file_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            return {'quality': encoding['quality'], 'original_bytes': original, 'bytes': len(data)}
+        except (OSError, ValueError) as e:
+            log_sync(f"Compaction re-encode failed for {file_path}: {e}", 'warning')
+            return None
+
+    def _remove_file(self, file_path):
+        try:
+            os.remove(file_path)
+            if is_delta_file(file_path) and os.path.exists(manifest_path_for(file_path)):
+                os.remove(manifest_path_for(file_path))
+        except OSError:
+            pass
@@ -10,7 +10,13 @@ API_BASE_URL = "https://att.igenhr.com/api"
 API_TOKEN_URL = f"{API_BASE_URL}/token/"
 API_TOKEN_REFRESH_URL = f"{API_BASE_URL}/token/refresh/"
 API_SCREENSHOT_UPLOAD_URL = f"{API_BASE_URL}/screenshots/upload/"
+API_SCREENSHOT_BUNDLE_URL = f"{API_BASE_URL}/screenshots/upload-bundle/"
+API_UPLOAD_SESSIONS_URL = f"{API_BASE_URL}/screenshots/upload-sessions/"
 API_SYNC_STATUS_URL = f"{API_BASE_URL}/sync-status/"
+API_SYNC_CHECK_URL = f"{API_BASE_URL}/sync-status/check/"
+API_SCREENSHOT_PREFLIGHT_URL = f"{API_BASE_URL}/screenshots/preflight/"
+API_SCREENSHOT_REFERENCE_URL = f"{API_BASE_URL}/screenshots/upload-reference/"
+API_ACTIVITY_UPLOAD_URL = f"{API_BASE_URL}/activity/upload/"
 
 # Attendance & Task APIs
 API_CHECKIN_URL = f"{API_BASE_URL}/attendance/checkin/"
@@ -21,18 +27,112 @@ API_TASKS_URL = f"{API_BASE_URL}/tasks/"
 API_ACCESS_CHECK_URL = f"{API_BASE_URL}/access-check/"
 API_PROFILE_URL = f"{API_BASE_URL}/profile/"
 
+# API Client Settings
+API_TIMEOUT = 10  # seconds per API call (uploads pass their own)
+API_RETRIES = 2  # Retries for idempotent calls on connect errors and 502/503/504
+API_POOL_SIZE = 8  # Keep-alive connections to the API host - covers UPLOAD_WORKERS plus UI/chat calls
+TOKEN_REFRESH_SKEW = 120  # seconds before access token expiry to refresh it in the background
+
 # Local Storage Paths
 DATA_DIR = os.path.join(BASE_DIR, "data")
 SCREENSHOTS_DIR = os.path.join(BASE_DIR, "screenshots")
 AUTH_TOKEN_FILE = os.path.join(DATA_DIR, "auth_token.json")
-UPLOAD_QUEUE_FILE = os.path.join(DATA_DIR, "upload_queue.json")
+UPLOAD_QUEUE_FILE = os.path.join(DATA_DIR, "upload_queue.json")  # Legacy - migrated to UPLOAD_QUEUE_DB
+UPLOAD_QUEUE_DB = os.path.join(DATA_DIR, "upload_queue.db")
 TC_ACCEPTANCE_FILE = os.path.join(DATA_DIR, "tc_accepted.json")
 PROFILE_INFO_FILE = os.path.join(DATA_DIR, "profile_info.json")
+WINDOW_SETTINGS_FILE = os.path.join(DATA_DIR, "window_settings.json")
+ACTIVITY_LOG_FILE = os.path.join(DATA_DIR, "activity.bin")
+STATE_SAVE_DEBOUNCE = 1.0  # seconds to coalesce writes of the JSON state files above
 
 # Screenshot Settings
 SCREENSHOT_INTERVAL = 30  # seconds
+SCREENSHOT_JITTER = 3  # Random +/- seconds per slot to spread fleet uploads
+SCREENSHOT_SINGLE_GRAB = False  # Grab the virtual desktop once and slice out each monitor
 IMAGE_QUALITY = 50
 IMAGE_FORMAT = "WEBP"
+IMAGE_METHOD = 6  # WebP encoder effort (0 = fastest, 6 = smallest)
+
+# Encoding Policy Settings
+IMAGE_MAX_WIDTH = 2560  # Downscale wider screens (0 = no cap)
+IMAGE_MAX_HEIGHT = 1440  # Downscale taller screens (0 = no cap)
+IMAGE_BYTE_BUDGET = 300 * 1024  # Target max bytes per frame (0 = no budget)
+IMAGE_MIN_QUALITY = 20  # Never drop quality below this to meet the budget
+IMAGE_MAX_ENCODE_ATTEMPTS = 3  # Encodes per frame while searching for the budget
+# (min CPU headroom %, WebP method) - first matching row wins
+ENCODE_METHOD_BY_HEADROOM = ((50, 6), (25, 4), (0, 2))
+
+# Delta Frame Settings
+DELTA_FRAMES_ENABLED = False  # Store changed tiles against periodic keyframes
+DELTA_TILE_SIZE = 128  # Tile edge in output pixels
+DELTA_KEYFRAME_INTERVAL = 20  # Deltas per screen before a new keyframe
+DELTA_MAX_CHANGED_RATIO = 0.5  # Emit a keyframe instead if more tiles changed
+
+# Encoder Pool Settings
+ENCODE_WORKERS = 2  # Worker processes for WebP encoding (0 = encode inline)
+ENCODE_MAX_PENDING = 6  # Frames waiting for an encoder before new ones are dropped
+ENCODE_DOWNGRADE_METHOD = 2  # Faster WebP method used while encoders are behind
+ENCODE_SHARED_MEMORY = True  # Hand frames to encoders via shared memory, not pickling
+
+# Change Detection Settings
+CHANGE_DETECTION_ENABLED = True
+CHANGE_THRESHOLD = 0.005  # Fraction of sampled pixels that must differ
+CHANGE_PIXEL_TOLERANCE = 12  # Per-pixel intensity delta treated as noise
+CHANGE_SAMPLE_STEP = 8  # Compare every 8th pixel in each direction
+CHANGE_KEEPALIVE_SECONDS = 600  # Keep at least one frame per screen every 10 minutes
+
+# Activity Tracking Settings
+ACTIVITY_POLL_INTERVAL = 2  # seconds between window checks when changes aren't pushed
+ACTIVITY_PUSH_POLL_INTERVAL = 30  # seconds between safety checks with the X11 push backend
+ACTIVITY_UPLOAD_INTERVAL = 300  # seconds between timeline uploads
+ACTIVITY_UPLOAD_BATCH = 2000  # events per upload request
+ACTIVITY_MAX_PENDING_EVENTS = 50000  # oldest events are dropped beyond this while uploads fail
+
+# Upload Queue Settings
+QUEUE_UPLOADED_RETENTION = 10000  # Uploaded records kept to avoid re-uploading
+UPLOAD_BATCH_SIZE = 20  # Files handed to the upload workers per batch
+UPLOAD_WORKERS = 4  # Concurrent upload threads sharing one connection pool
+UPLOAD_PER_HOST_LIMIT = 4  # Max simultaneous requests to one host
+UPLOAD_MAX_BACKOFF = 60  # Max seconds to pause after 429/503 responses
+UPLOAD_BUNDLE_ENABLED = False  # Send several screenshots per request (server must support it)
+UPLOAD_BUNDLE_SIZE = 10  # Files per bundle request
+UPLOAD_RESUMABLE_ENABLED = True  # Chunked, resumable uploads for large files
+UPLOAD_CHUNK_THRESHOLD = 1024 * 1024  # Files at least this big (bytes) are sent in chunks
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Bytes per chunk request
+UPLOAD_CHUNK_RETRIES = 3  # Chunk failures tolerated per attempt before requeueing
+UPLOAD_MAX_ATTEMPTS = 8  # Failed attempts before an item is dead-lettered
+UPLOAD_RETRY_BASE_DELAY = 30  # seconds - doubles per attempt, with jitter
+UPLOAD_RETRY_MAX_DELAY = 3600  # Retry delay cap (seconds)
+SYNC_CHECK_BATCH_SIZE = 5000  # Path digests per incremental sync-status request
+UPLOAD_FRESH_WINDOW = 600  # Captures newer than this (seconds) upload first, newest first
+UPLOAD_BACKLOG_SHARE = 0.25  # Minimum share of each batch given to the older backlog
+UPLOAD_DEDUP_ENABLED = True  # Send only metadata for frames the server already has
+CONTENT_INDEX_RETENTION = 100000  # Uploaded content hashes remembered locally
+
+# Backlog Compaction Settings
+COMPACTION_ENABLED = False  # Thin/re-encode old pending screenshots before upload - deletes frames, opt in
+COMPACTION_INTERVAL = 600  # seconds between compaction passes
+COMPACTION_AGE = 3 * 24 * 3600  # Pending frames older than this (seconds) are compacted
+COMPACTION_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Above this backlog size, compact everything but fresh frames
+COMPACTION_THIN_MINUTES = 5  # Keep one frame per screen per this many minutes
+COMPACTION_QUALITY = 40  # Re-encode quality for kept frames (0 = don't re-encode)
+COMPACTION_BYTE_BUDGET = 150 * 1024  # Target size of a re-encoded frame
+
+# Bandwidth Settings
+UPLOAD_BANDWIDTH_LIMIT = 0  # Upload cap in bytes/s (0 = unlimited)
+UPLOAD_BANDWIDTH_SCHEDULE = ()  # (('09:00', '18:00', 256 * 1024), ...) - first matching window overrides the cap
+UPLOAD_BANDWIDTH_FLOOR = 32 * 1024  # Latency throttling never goes below this (bytes/s)
+UPLOAD_LATENCY_THROTTLE = False  # Slow uploads down when they inflate round-trip latency (probes the API host)
+UPLOAD_LATENCY_THROTTLE_FACTOR = 3.0  # Throttle when RTT exceeds the idle baseline by this factor
+UPLOAD_LATENCY_PROBE_INTERVAL = 5  # seconds between RTT probes while uploading
+UPLOAD_LATENCY_BASELINE_INTERVAL = 60  # seconds between idle RTT probes that set the baseline
+
+# Connectivity Settings
+CONNECTIVITY_IDLE_PROBE_INTERVAL = 60  # Probe our API host only after this many idle seconds
+CONNECTIVITY_FAILURE_THRESHOLD = 3  # Consecutive network failures before going offline
+CONNECTIVITY_MIN_BACKOFF = 5  # First re-probe delay (seconds) once offline
+CONNECTIVITY_MAX_BACKOFF = 300  # Re-probe delay cap while offline
+CONNECTIVITY_PROBE_TIMEOUT = 3  # seconds
 
 # Cleanup Settings
 CLEANUP_DAYS = 7  # Delete files older than 7 days
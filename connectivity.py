@@ -0,0 +1,110 @@
+# connectivity.py - Passive connectivity state machine
+
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from config import (
+    API_BASE_URL, CONNECTIVITY_IDLE_PROBE_INTERVAL, CONNECTIVITY_FAILURE_THRESHOLD,
+    CONNECTIVITY_MIN_BACKOFF, CONNECTIVITY_MAX_BACKOFF, CONNECTIVITY_PROBE_TIMEOUT
+)
+from debug_logger import log_sync
+
+ONLINE = 'online'
+DEGRADED = 'degraded'  # Reachable but failing (5xx, sporadic timeouts)
+OFFLINE = 'offline'
+
+
+class ConnectivityMonitor:
+    """Track reachability of our API from the outcomes of real requests"""
+
+    def __init__(self, probe_url=None):
+        parts = urlsplit(API_BASE_URL)
+        self.probe_url = probe_url or f"{parts.scheme}://{parts.netloc}/"
+        self.state = ONLINE  # Optimistic until a request says otherwise
+        self.failures = 0
+        self.last_outcome = 0.0  # time.monotonic() of the last real or probe result
+        self.backoff = CONNECTIVITY_MIN_BACKOFF
+        self.next_probe = 0.0
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+
+    def is_online(self):
+        """Cached answer - never touches the network"""
+        return self.state != OFFLINE
+
+    def get_state(self):
+        return self.state
+
+    def record_response(self, response):
+        """Feed an HTTP response from any API call"""
+        if response.status_code >= 500:
+            self._record(DEGRADED)
+        else:
+            self._record(ONLINE)  # 2xx-4xx: the server answered
+
+    def record_error(self, error=None):
+        """Feed a network-level failure (connection refused, DNS, timeout)"""
+        self._record(None)
+
+    def check(self):
+        """Return whether to attempt network work, probing only when idle or backoff expired"""
+        now = time.monotonic()
+        with self.lock:
+            if self.state == OFFLINE:
+                due = now >= self.next_probe
+            else:
+                due = now - self.last_outcome >= CONNECTIVITY_IDLE_PROBE_INTERVAL
+        if due:
+            self.probe()
+        return self.is_online()
+
+    def probe(self):
+        """Cheap HEAD against our own API host, over the shared keep-alive session"""
+        from api_client import get_api_client  # api_client imports this module
+        if not self.probe_lock.acquire(blocking=False):
+            return self.is_online()  # Another thread is already probing
+        try:
+            response = get_api_client().session.head(self.probe_url, timeout=CONNECTIVITY_PROBE_TIMEOUT,
+                                                     allow_redirects=False)
+            self.record_response(response)
+        except requests.exceptions.RequestException as e:
+            self.record_error(e)
+        finally:
+            self.probe_lock.release()
+        return self.is_online()
+
+    def _record(self, outcome):
+        """Apply one outcome - None means a network failure"""
+        now = time.monotonic()
+        with self.lock:
+            previous = self.state
+            self.last_outcome = now
+            if outcome is None:
+                self.failures += 1
+                if self.failures >= CONNECTIVITY_FAILURE_THRESHOLD:
+                    if previous == OFFLINE:
+                        self.backoff = min(CONNECTIVITY_MAX_BACKOFF, self.backoff * 2)
+                    self.state = OFFLINE
+                    self.next_probe = now + self.backoff
+                else:
+                    self.state = DEGRADED
+            else:
+                self.failures = 0
+                self.backoff = CONNECTIVITY_MIN_BACKOFF
+                self.state = outcome
+            state = self.state
+        if state != previous:
+            level = 'info' if state == ONLINE else 'warning'
+            log_sync(f"Connectivity: {previous} -> {state}", level)
+
+
+# Singleton instance
+_connectivity_monitor = None
+
+def get_connectivity_monitor():
+    """Get or create connectivity monitor instance"""
+    global _connectivity_monitor
+    if _connectivity_monitor is None:
+        _connectivity_monitor = ConnectivityMonitor()
+    return _connectivity_monitor
@@ -29,6 +29,7 @@ screenshot_logger = logging.getLogger('SCREENSHOT')
 sync_logger = logging.getLogger('SYNC')
 task_logger = logging.getLogger('TASK')
 browser_logger = logging.getLogger('BROWSER')
+activity_logger = logging.getLogger('ACTIVITY')
 main_logger = logging.getLogger('MAIN')
 
 def log_auth(message, level='info'):
@@ -76,6 +77,15 @@ def log_browser(message, level='info'):
     else:
         browser_logger.info(message)
 
+def log_activity(message, level='info'):
+    """Log window activity tracking events"""
+    if level == 'error':
+        activity_logger.error(message)
+    elif level == 'warning':
+        activity_logger.warning(message)
+    else:
+        activity_logger.info(message)
+
 def log_main(message, level='info'):
     """Log main app events"""
     if level == 'error':
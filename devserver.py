@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the upload API - used by the sync benchmarks
+Usage: python devserver.py [port] [--latency MS] [--rate-limit FRACTION] [--no-bundles]
+                           [--drop-rate FRACTION] [--tls CERTFILE KEYFILE]
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import ssl
+import socket
+import hashlib
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DROP_UNIT = 256 * 1024  # --drop-rate is the chance of a drop per this many bytes
+CONTENT_HASH_FIELD = re.compile(rb'name="content_sha256"\r\n\r\n([0-9a-f]{64})')
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP/1.1 server that counts connections and requests"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, rate_limit=0.0, retry_after=1, bundles=True, drop_rate=0.0,
+                 poison=(), known_paths=(), sync_check=True, tls=None):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.tls = tls  # (certfile, keyfile) to serve HTTPS
+        if tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*tls)
+            # Handshake in the handler thread, not in the accept loop
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.latency = latency  # Seconds added to every response
+        self.rate_limit = rate_limit  # Fraction of uploads answered with 429
+        self.retry_after = retry_after
+        self.bundles = bundles  # Serve the multi-file bundle endpoint
+        self.drop_rate = drop_rate  # Chance of the link dropping per 256 KB received
+        self.poison = [p.encode('utf-8') for p in poison]  # Uploads mentioning these get HTTP 500
+        self.known_paths = list(known_paths)  # Relative paths the server already has
+        self.sync_check = sync_check  # Serve the incremental sync-status check
+        self.content_hashes = set()  # SHA-256 of every stored file
+        self.references = 0
+        self.sessions = {}  # upload_id -> {'data': bytearray, 'size', 'sha256'}
+        self.connections = 0
+        self.requests = 0
+        self.uploads = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.tls else 'http'
+        return f"{scheme}://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API behind nginx
+    disable_nagle_algorithm = True  # Avoid delayed-ACK stalls on reused connections
+
+    def setup(self):
+        if self.server.tls:
+            self.request.do_handshake()
+        super().setup()
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count('requests')
+        self._reply(200, {'uploaded_paths': self.server.known_paths})
+
+    def do_HEAD(self):
+        self.server.count('requests')
+        headers = {'Content-Length': '0'}
+        if '/upload-sessions/' in self.path:
+            session = self._session()
+            if not session:
+                self._reply(404, None)
+                return
+            headers['Upload-Offset'] = str(len(session['data']))
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_PATCH(self):
+        """Append a chunk to an upload session - may drop the connection halfway"""
+        self.server.count('requests')
+        session = self._session()
+        length = int(self.headers.get('Content-Length', 0))
+        if not session:
+            self.rfile.read(length)
+            self._reply(404, {'detail': 'Unknown upload session'})
+            return
+        if self._drops(length):
+            # Keep what arrived before the link went away
+            partial = self._drop(length)
+            if int(self.headers.get('Upload-Offset', -1)) == len(session['data']):
+                session['data'] += partial
+            return
+        chunk = self.rfile.read(length)
+        self.server.count('bytes_received', len(chunk))
+        if int(self.headers.get('Upload-Offset', -1)) != len(session['data']):
+            self._reply(409, {'detail': 'Offset mismatch'}, {'Upload-Offset': str(len(session['data']))})
+            return
+        session['data'] += chunk
+        self._reply(204, None, {'Upload-Offset': str(len(session['data']))})
+
+    def _drops(self, length):
+        """Whether the simulated link fails while receiving `length` bytes"""
+        if not self.server.drop_rate:
+            return False
+        return random.random() < 1 - (1 - self.server.drop_rate) ** (length / DROP_UNIT)
+
+    def _drop(self, length):
+        """Read half the body, then cut the connection without answering"""
+        partial = self.rfile.read(length // 2)
+        self.server.count('dropped')
+        self.server.count('bytes_received', len(partial))
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+        return partial
+
+    def _session(self):
+        parts = [part for part in self.path.split('/') if part]
+        upload_id = parts[parts.index('upload-sessions') + 1] if parts[-1] != 'upload-sessions' else None
+        return self.server.sessions.get(upload_id)
+
+    def do_POST(self):
+        self.server.count('requests')
+        length = int(self.headers.get('Content-Length', 0))
+        if '/upload-sessions/' not in self.path and self._drops(length):
+            self._drop(length)
+            return
+        body = self.rfile.read(length)
+        if '/upload-sessions/' in self.path:
+            self._session_post(body)
+            return
+        if self.path.rstrip('/').endswith('sync-status/check'):
+            self._sync_check(body)
+            return
+        if self.path.rstrip('/').endswith('preflight'):
+            hashes = json.loads(body).get('sha256', [])
+            self._reply(200, {'have': [h for h in hashes if h in self.server.content_hashes]})
+            return
+        if self.path.rstrip('/').endswith('upload-reference'):
+            match = re.search(rb'content_sha256=([0-9a-f]{64})', body)
+            if not match or match.group(1).decode() not in self.server.content_hashes:
+                self._reply(404, {'detail': 'Unknown content'})
+                return
+            self.server.count('references')
+            self._reply(201, {'status': 'created'})
+            return
+        self.server.count('bytes_received', length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.rate_limit and random.random() < self.server.rate_limit:
+            self.server.count('rejected')
+            self._reply(429, {'detail': 'Too many requests'},
+                        {'Retry-After': str(self.server.retry_after)})
+            return
+        if self.path.rstrip('/').endswith('upload-bundle'):
+            self._bundle(body)
+            return
+        if any(p in body for p in self.server.poison):
+            self._reply(500, {'detail': 'Internal server error'})
+            return
+        match = CONTENT_HASH_FIELD.search(body)
+        if match:
+            self.server.content_hashes.add(match.group(1).decode())
+        self.server.count('uploads')
+        self._reply(201, {'status': 'ok'})
+
+    def _session_post(self, body):
+        """Create an upload session, or complete one and verify its hash"""
+        if self.path.rstrip('/').endswith('upload-sessions'):
+            info = json.loads(body)
+            upload_id = uuid.uuid4().hex
+            self.server.sessions[upload_id] = {'data': bytearray(), 'size': info['size'], 'sha256': info['sha256']}
+            self._reply(201, {'upload_id': upload_id})
+            return
+        session = self._session()
+        if not session:
+            self._reply(404, {'detail': 'Unknown upload session'})
+            return
+        if hashlib.sha256(session['data']).hexdigest() != json.loads(body).get('sha256'):
+            session['data'] = bytearray()
+            self._reply(409, {'detail': 'Hash mismatch'})
+            return
+        self.server.content_hashes.add(session['sha256'])
+        self.server.count('uploads')
+        self._reply(201, {'status': 'created'})
+
+    def _sync_check(self, body):
+        """Answer which of the sent path digests are already uploaded"""
+        if not self.server.sync_check:
+            self._reply(404, {'detail': 'Not found'})
+            return
+        with self.server.lock:
+            if getattr(self.server, 'known_digests', None) is None:
+                self.server.known_digests = {
+                    hashlib.blake2b(path.encode('utf-8'), digest_size=8).hexdigest()
+                    for path in self.server.known_paths
+                }
+        digests = json.loads(body).get('digests', [])
+        self._reply(200, {'uploaded': [d for d in digests if d in self.server.known_digests]})
+
+    def _bundle(self, body):
+        """Accept every file listed in the bundle manifest"""
+        if not self.server.bundles:
+            self._reply(404, {'detail': 'Not found'})
+            return
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=policy.default).parsebytes(header + body)
+        manifest, parts = [], set()
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'manifest':
+                manifest = json.loads(part.get_content())
+            else:
+                parts.add(name)
+        results = []
+        for entry in manifest:
+            status = 'created' if entry.get('part') in parts else 'error'
+            if status == 'created':
+                self.server.count('uploads')
+                if entry.get('content_sha256'):
+                    self.server.content_hashes.add(entry['content_sha256'])
+            results.append({'relative_path': entry.get('relative_path'), 'status': status})
+        self._reply(207, {'results': results})
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count('bytes_sent', len(body))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'latency': 0.0, 'rate_limit': 0.0, 'bundles': True}
+    port = 8000
+    while args:
+        arg = args.pop(0)
+        if arg == '--latency':
+            options['latency'] = float(args.pop(0)) / 1000
+        elif arg == '--rate-limit':
+            options['rate_limit'] = float(args.pop(0))
+        elif arg == '--no-bundles':
+            options['bundles'] = False
+        elif arg == '--drop-rate':
+            options['drop_rate'] = float(args.pop(0))
+        elif arg == '--tls':
+            options['tls'] = (args.pop(0), args.pop(0))
+        else:
+            port = int(arg)
+    server = StandInServer(port, **options)
+    print(f"Stand-in API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
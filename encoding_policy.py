@@ -0,0 +1,102 @@
+# encoding_policy.py - Resolution cap, byte budget and encoder effort per frame
+
+import io
+from PIL import Image
+from config import (
+    IMAGE_QUALITY, IMAGE_METHOD, IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT, IMAGE_BYTE_BUDGET,
+    IMAGE_MIN_QUALITY, IMAGE_MAX_ENCODE_ATTEMPTS, ENCODE_METHOD_BY_HEADROOM
+)
+
+# psutil is optional - without it the configured method is always used
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+class EncodingPolicy:
+    """Decide output size, starting quality and WebP method for each frame"""
+
+    def __init__(self):
+        self.quality_hints = {}  # screen -> quality that last fitted the budget
+        if PSUTIL_AVAILABLE:
+            psutil.cpu_percent(interval=None)  # Prime the CPU counter
+
+    def plan(self, screen, size):
+        """Build the encode plan for one frame of the given native size"""
+        return {
+            'target_size': capped_size(size, IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT),
+            'quality': self.quality_hints.get(screen, IMAGE_QUALITY),
+            'min_quality': IMAGE_MIN_QUALITY,
+            'byte_budget': IMAGE_BYTE_BUDGET,
+            'max_attempts': IMAGE_MAX_ENCODE_ATTEMPTS,
+            'method': self._method_for_headroom()
+        }
+
+    def record(self, screen, quality, size_bytes):
+        """Remember the quality that worked so the next frame starts there"""
+        if IMAGE_BYTE_BUDGET and size_bytes < IMAGE_BYTE_BUDGET // 2:
+            # Well under budget - try a little more quality next time
+            quality = min(IMAGE_QUALITY, quality + 5)
+        self.quality_hints[screen] = quality
+
+    def forget(self, screen):
+        self.quality_hints.pop(screen, None)
+
+    def _method_for_headroom(self):
+        """Pick the WebP effort from current CPU headroom"""
+        if not PSUTIL_AVAILABLE:
+            return IMAGE_METHOD
+        headroom = 100 - psutil.cpu_percent(interval=None)
+        for min_headroom, method in ENCODE_METHOD_BY_HEADROOM:
+            if headroom >= min_headroom:
+                return min(method, IMAGE_METHOD)
+        return ENCODE_METHOD_BY_HEADROOM[-1][1]
+
+
+def capped_size(size, max_width, max_height):
+    """Scale (width, height) down to fit the cap, keeping the aspect ratio"""
+    width, height = size
+    scale = 1.0
+    if max_width and width > max_width:
+        scale = max_width / width
+    if max_height and height * scale > max_height:
+        scale = max_height / height
+    if scale >= 1.0:
+        return size
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def resize_to_plan(img, plan):
+    """Downscale an image to the plan's capped output size"""
+    if img.size == tuple(plan['target_size']):
+        return img
+    # reducing_gap does a fast integer reduce before the Lanczos pass
+    return img.resize(plan['target_size'], Image.LANCZOS, reducing_gap=3.0)
+
+
+def encode_to_budget(img, image_format, plan):
+    """Encode an image, lowering quality until it fits the byte budget"""
+    quality = plan['quality']
+    budget = plan['byte_budget']
+    attempts = 0
+    while True:
+        attempts += 1
+        buffer = io.BytesIO()
+        img.save(buffer, image_format, quality=quality, method=plan['method'])
+        data = buffer.getvalue()
+        if (not budget or len(data) <= budget or quality <= plan['min_quality']
+                or attempts >= plan['max_attempts']):
+            break
+        # Step down in proportion to how far over budget the frame is
+        step = max(5, int(quality * (1 - budget / len(data))))
+        quality = max(plan['min_quality'], quality - step)
+
+    return data, {
+        'quality': quality,
+        'method': plan['method'],
+        'output_size': list(img.size),
+        'attempts': attempts,
+        'byte_budget': budget
+    }
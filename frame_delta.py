@@ -0,0 +1,178 @@
+# frame_delta.py - Tile-based keyframe/delta frames and reconstruction
+
+import os
+import sys
+import json
+import math
+import hashlib
+import tempfile
+from PIL import Image
+from encoding_policy import encode_to_budget
+from config import (
+    SCREENSHOTS_DIR, DELTA_TILE_SIZE, DELTA_KEYFRAME_INTERVAL, DELTA_MAX_CHANGED_RATIO
+)
+
+DELTA_SUFFIX = '.delta.webp'
+MANIFEST_VERSION = 1
+
+
+class KeyframeTracker:
+    """Track the current keyframe per screen and decide keyframe vs delta"""
+
+    def __init__(self, tile_size=DELTA_TILE_SIZE, interval=DELTA_KEYFRAME_INTERVAL,
+                 max_changed_ratio=DELTA_MAX_CHANGED_RATIO):
+        self.tile_size = tile_size
+        self.interval = interval
+        self.max_changed_ratio = max_changed_ratio
+        self.screens = {}  # screen -> {'keyframe', 'hashes', 'frames_since'}
+
+    def plan_for(self, screen):
+        """Build the 'delta' section of an encode plan"""
+        plan = {
+            'tile_size': self.tile_size,
+            'max_changed_ratio': self.max_changed_ratio,
+            'keyframe': None,
+            'ref_hashes': None
+        }
+        state = self.screens.get(screen)
+        if state and state['frames_since'] < self.interval:
+            plan['keyframe'] = state['keyframe']
+            plan['ref_hashes'] = state['hashes']
+        return plan
+
+    def record(self, screen, file_path, frame):
+        """Update state from an encoder result"""
+        if frame['frame_type'] == 'keyframe':
+            self.screens[screen] = {
+                'keyframe': os.path.relpath(file_path, SCREENSHOTS_DIR),
+                'hashes': frame['tile_hashes'],
+                'frames_since': 0
+            }
+        elif screen in self.screens:
+            self.screens[screen]['frames_since'] += 1
+
+    def forget(self, screen):
+        self.screens.pop(screen, None)
+
+
+def tile_boxes(size, tile_size):
+    """Tile rectangles (left, top, right, bottom) in row-major order"""
+    width, height = size
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in range(0, height, tile_size)
+        for x in range(0, width, tile_size)
+    ]
+
+
+def tile_hashes(img, boxes):
+    """Short content hash of every tile"""
+    return [hashlib.blake2b(img.crop(box).tobytes(), digest_size=8).hexdigest() for box in boxes]
+
+
+def encode_tiled(img, image_format, plan):
+    """Encode img as a keyframe, or as a delta of changed tiles against the keyframe"""
+    delta_plan = plan['delta']
+    tile_size = delta_plan['tile_size']
+    boxes = tile_boxes(img.size, tile_size)
+    hashes = tile_hashes(img, boxes)
+
+    ref_hashes = delta_plan.get('ref_hashes')
+    if ref_hashes and len(ref_hashes) == len(hashes):
+        changed = [i for i, (new, old) in enumerate(zip(hashes, ref_hashes)) if new != old]
+        if len(changed) <= len(boxes) * delta_plan['max_changed_ratio']:
+            atlas, tiles = _build_atlas(img, [boxes[i] for i in changed], tile_size)
+            data, encoding = encode_to_budget(atlas, image_format, plan)
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'frame_type': 'delta',
+                'keyframe': delta_plan['keyframe'],
+                'frame_size': list(img.size),
+                'tile_size': tile_size,
+                'tile_count': len(boxes),
+                'tiles': tiles
+            }
+            return data, encoding, {'frame_type': 'delta', 'manifest': manifest}
+
+    # No usable keyframe, or too much changed - emit a new keyframe
+    data, encoding = encode_to_budget(img, image_format, plan)
+    return data, encoding, {'frame_type': 'keyframe', 'tile_hashes': hashes}
+
+
+def _build_atlas(img, boxes, tile_size):
+    """Pack changed tiles into a compact grid - returns (atlas, manifest tiles)"""
+    columns = max(1, math.ceil(math.sqrt(len(boxes))))
+    rows = max(1, math.ceil(len(boxes) / columns))
+    atlas = Image.new("RGB", (columns * tile_size, rows * tile_size))
+    tiles = []
+    for idx, box in enumerate(boxes):
+        ax = (idx % columns) * tile_size
+        ay = (idx // columns) * tile_size
+        atlas.paste(img.crop(box), (ax, ay))
+        # [x, y, width, height, atlas_x, atlas_y]
+        tiles.append([box[0], box[1], box[2] - box[0], box[3] - box[1], ax, ay])
+    return atlas, tiles
+
+
+def delta_path_for(file_path):
+    """'.../12-00-00.webp' -> '.../12-00-00.delta.webp'"""
+    return os.path.splitext(file_path)[0] + DELTA_SUFFIX
+
+
+def manifest_path_for(delta_path):
+    """'.../12-00-00.delta.webp' -> '.../12-00-00.delta.json'"""
+    return os.path.splitext(delta_path)[0] + '.json'
+
+
+def is_delta_file(file_path):
+    return file_path.endswith(DELTA_SUFFIX)
+
+
+def write_manifest(delta_path, manifest):
+    with open(manifest_path_for(delta_path), 'w') as f:
+        json.dump(manifest, f)
+
+
+def load_manifest(delta_path):
+    """Load a delta's manifest (None if missing or unreadable)"""
+    try:
+        with open(manifest_path_for(delta_path), 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+
+
+def reconstruct(delta_path, keyframe_path=None):
+    """Rebuild the full frame from a keyframe and a delta"""
+    manifest = load_manifest(delta_path)
+    if not manifest:
+        raise ValueError(f"No manifest for {delta_path}")
+    if keyframe_path is None:
+        keyframe_path = os.path.join(SCREENSHOTS_DIR, manifest['keyframe'])
+
+    frame = Image.open(keyframe_path).convert("RGB")
+    if list(frame.size) != manifest['frame_size']:
+        raise ValueError(f"Keyframe size {frame.size} does not match delta {manifest['frame_size']}")
+
+    atlas = Image.open(delta_path).convert("RGB")
+    for x, y, width, height, ax, ay in manifest['tiles']:
+        frame.paste(atlas.crop((ax, ay, ax + width, ay + height)), (x, y))
+    return frame
+
+
+if __name__ == '__main__':
+    # Verification: python frame_delta.py <delta.webp> [keyframe.webp] [output.png]
+    if len(sys.argv) < 2:
+        print("Usage: python frame_delta.py <delta.webp> [keyframe.webp] [output.png]")
+        sys.exit(1)
+    delta = sys.argv[1]
+    keyframe = sys.argv[2] if len(sys.argv) > 2 else None
+    # Default next to other temp files - anything under SCREENSHOTS_DIR gets picked up and uploaded
+    name = os.path.basename(delta).split('.')[0]
+    output = sys.argv[3] if len(sys.argv) > 3 else os.path.join(tempfile.gettempdir(), name + '.full.png')
+    screenshots_dir = os.path.abspath(SCREENSHOTS_DIR)
+    if os.path.commonpath([os.path.abspath(output), screenshots_dir]) == screenshots_dir:
+        print(f"Output must be outside {SCREENSHOTS_DIR} - files there are uploaded")
+        sys.exit(1)
+    reconstruct(delta, keyframe).save(output)
+    print(f"Reconstructed frame saved: {output}")
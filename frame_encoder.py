@@ -0,0 +1,199 @@
+# frame_encoder.py - Background Frame Encoding Pool
+
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PIL import Image
+from encoding_policy import encode_to_budget, resize_to_plan
+from frame_delta import encode_tiled, delta_path_for, write_manifest
+from config import (
+    ENCODE_WORKERS, ENCODE_MAX_PENDING, ENCODE_DOWNGRADE_METHOD, ENCODE_SHARED_MEMORY
+)
+from debug_logger import log_screenshot
+
+
+def encode_frame(raw, size, file_path, image_format, plan):
+    """Convert a raw BGRA frame to RGB and save it - runs in a worker process"""
+    started_at = time.time()
+    started = time.perf_counter()
+    # Decode straight from the BGRA buffer - no intermediate RGB bytes object
+    img = Image.frombytes("RGB", size, raw, "raw", "BGRX")
+    converted = time.perf_counter()
+    img = resize_to_plan(img, plan)
+
+    frame = None
+    if plan.get('delta'):
+        data, encoding, frame = encode_tiled(img, image_format, plan)
+        if frame['frame_type'] == 'delta':
+            file_path = delta_path_for(file_path)
+            write_manifest(file_path, frame['manifest'])
+    else:
+        data, encoding = encode_to_budget(img, image_format, plan)
+    finished = time.perf_counter()
+
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return {
+        'file_path': file_path,
+        'started_at': started_at,
+        'convert_ms': round((converted - started) * 1000, 1),
+        'encode_ms': round((finished - converted) * 1000, 1),
+        'bytes': len(data),
+        'encoding': encoding,
+        'frame': frame
+    }
+
+
+def encode_shared_frame(shm_name, nbytes, size, file_path, image_format, plan):
+    """Encode a frame the capture process placed in shared memory"""
+    # Pool workers share the capture process's resource tracker, so attaching
+    # here does not transfer ownership - the capture process unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        with shm.buf[:nbytes] as view:
+            return encode_frame(view, size, file_path, image_format, plan)
+    finally:
+        shm.close()
+
+
+class FrameEncoderPool:
+    """Bounded process pool that encodes frames off the capture thread"""
+
+    def __init__(self, workers=ENCODE_WORKERS, max_pending=ENCODE_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.executor = None
+        self.pending = 0
+        self.dropped_count = 0
+        self.downgraded_count = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start worker processes (falls back to inline encoding on failure)"""
+        if self.executor or self.workers <= 0:
+            return
+        self.executor = self._create_executor()
+        if self.executor:
+            log_screenshot(f"Encoder pool started with {self.workers} worker(s)")
+
+    def _create_executor(self):
+        try:
+            # Spawn, not fork - forking a multithreaded Qt process can deadlock the child
+            return ProcessPoolExecutor(max_workers=self.workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        except Exception as e:
+            log_screenshot(f"Encoder pool unavailable, encoding inline: {e}", 'warning')
+            return None
+
+    def _rebuild(self, broken, error):
+        """Replace a pool whose worker died - later frames go to the new one"""
+        with self.lock:
+            if self.executor is not broken:
+                return  # Already replaced, or shut down on purpose
+            self.executor = None
+        log_screenshot(f"Encoder worker died ({error}) - restarting the pool", 'warning')
+        broken.shutdown(wait=False, cancel_futures=True)
+        executor = self._create_executor()
+        with self.lock:
+            if self.executor is None:
+                self.executor = executor
+                return
+        if executor:
+            executor.shutdown(wait=False)  # Lost the race to another rebuild
+
+    def shutdown(self, wait=True):
+        """Stop worker processes - queued frames still finish in the background"""
+        executor, self.executor = self.executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+    def admit(self, method):
+        """Apply backpressure - returns the encoder method to use, or None to drop"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.dropped_count += 1
+                return None
+            if self.pending >= max(1, self.workers):
+                self.downgraded_count += 1
+                method = min(method, ENCODE_DOWNGRADE_METHOD)
+            self.pending += 1
+            return method
+
+    def submit(self, on_done, raw, size, file_path, image_format, plan):
+        """Encode a frame admitted via admit() and call on_done(result, error)"""
+        executor = self.executor
+        if not executor:
+            self._encode_inline(on_done, raw, size, file_path, image_format, plan)
+            return
+
+        # Hand the frame over through shared memory instead of pickling it
+        shm = self._share(raw) if ENCODE_SHARED_MEMORY else None
+
+        def _finished(future):
+            if shm:
+                shm.close()
+                shm.unlink()
+            try:
+                result, error = future.result(), None
+            except BrokenProcessPool as e:
+                # The worker died with this frame - restart the pool, encode it here
+                self._rebuild(executor, e)
+                self._encode_inline(on_done, raw, size, file_path, image_format, plan)
+                return
+            except Exception as e:
+                result, error = None, e
+            self._release()
+            on_done(result, error)
+
+        try:
+            if shm:
+                future = executor.submit(
+                    encode_shared_frame, shm.name, len(raw), size, file_path, image_format, plan
+                )
+            else:
+                future = executor.submit(
+                    encode_frame, raw, size, file_path, image_format, plan
+                )
+        except BrokenProcessPool as e:
+            if shm:
+                shm.close()
+                shm.unlink()
+            self._rebuild(executor, e)
+            self._encode_inline(on_done, raw, size, file_path, image_format, plan)
+            return
+        except Exception as e:
+            # Pool broken or shutting down
+            self._release()
+            if shm:
+                shm.close()
+                shm.unlink()
+            on_done(None, e)
+            return
+        future.add_done_callback(_finished)
+
+    def _encode_inline(self, on_done, raw, size, file_path, image_format, plan):
+        """Encode on the calling thread - no pool, or the pool is being rebuilt"""
+        try:
+            result = encode_frame(raw, size, file_path, image_format, plan)
+            error = None
+        except Exception as e:
+            result, error = None, e
+        self._release()
+        on_done(result, error)
+
+    def _share(self, raw):
+        """Copy a frame into a new shared memory block (None if unavailable)"""
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=len(raw))
+        except Exception as e:
+            log_screenshot(f"Shared memory unavailable, pickling frame: {e}", 'warning')
+            return None
+        shm.buf[:len(raw)] = raw
+        return shm
+
+    def _release(self):
+        with self.lock:
+            self.pending = max(0, self.pending - 1)
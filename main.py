@@ -16,13 +16,17 @@ from auth import AuthManager
 from screenshot_service import ScreenshotService
 from sync_manager import SyncManager
 from cleanup import CleanupManager
+from activity_tracker import ActivityTracker
 from task_manager import TaskManager
-from config import SCREENSHOTS_DIR
+from config import SCREENSHOTS_DIR, WINDOW_SETTINGS_FILE, TC_ACCEPTANCE_FILE
+from frame_delta import is_delta_file, manifest_path_for
 from ui_components import GradientWidget, GlassCard, HeaderWidget, BottomNavBar, C
 from pages import DashboardPage, TasksPage
 from profile_page_new import ProfilePage
 from chat_manager import ChatManager
 from chat_api import ChatAPI
+from api_client import get_api_client
+from state_store import get_state_file
 from chat_page import ChatPage
 
 
@@ -30,6 +34,7 @@ class SignalEmitter(QObject):
     capture_signal = pyqtSignal(list)
     sync_signal = pyqtSignal(str, bool)
     task_refresh_signal = pyqtSignal()
+    access_denied_signal = pyqtSignal(str, str)
 
 
 class LoginWidget(QWidget):
@@ -1155,10 +1160,11 @@ class MenuOverlay(QFrame):
 class Dashboard(QWidget):
     logout_signal = pyqtSignal()
 
-    def __init__(self, auth, ss, sync, cleanup, task, signals, notification_manager):
+    def __init__(self, auth, ss, sync, cleanup, task, signals, notification_manager, activity=None):
         super().__init__()
         self.auth = auth
         self.ss = ss
+        self.activity = activity
         self.sync = sync
         self.cleanup = cleanup
         self.task = task
@@ -1299,9 +1305,10 @@ class Dashboard(QWidget):
         self.signals.capture_signal.connect(self.on_capture)
         self.signals.sync_signal.connect(self.on_sync)
         
-        # Setup access denied callbacks
-        self.task.on_access_denied = self.on_access_denied
-        self.sync.on_access_denied = self.on_access_denied
+        # Setup access denied callback - every API call's 401 or account-level 403 lands here, on whichever
+        # thread made the call, so hop to the GUI thread through a signal
+        self.signals.access_denied_signal.connect(self.on_access_denied)
+        get_api_client().on_access_denied = lambda code, msg: self.signals.access_denied_signal.emit(code, msg)
 
     def on_access_denied(self, error_code, message):
         """Handle access denied from server - update UI"""
@@ -1319,6 +1326,8 @@ class Dashboard(QWidget):
         # Stop capturing if running
         if self.capturing:
             self.ss.stop()
+            if self.activity:
+                self.activity.stop()
             self.capturing = False
             self.dash_page.clock_out()
 
@@ -1357,6 +1366,8 @@ class Dashboard(QWidget):
         log_main("Starting screenshot service...")
         self.ss.on_capture_callback = lambda f: self.signals.capture_signal.emit(f)
         self.ss.start()
+        if self.activity:
+            self.activity.start()
         
         log_main("Starting sync service...")
         self.sync.start_sync()
@@ -1378,6 +1389,8 @@ class Dashboard(QWidget):
         
         log_main("Stopping screenshot service...")
         self.ss.stop()
+        if self.activity:
+            self.activity.stop()
         
         self.capturing = False
         log_main("✅ Work stopped")
@@ -1502,17 +1515,23 @@ class Dashboard(QWidget):
         if ok and path and os.path.exists(path):
             try:
                 os.remove(path)
+                if is_delta_file(path):
+                    os.remove(manifest_path_for(path))
             except:
                 pass
         self.auto_clean_old_folders()
 
     def auto_clean_old_folders(self):
+        """Remove past days' folders once they are empty - uploaded files are deleted as they sync"""
         if not os.path.exists(SCREENSHOTS_DIR):
             return
         today = datetime.now().strftime("%Y-%m-%d")
         for folder in os.listdir(SCREENSHOTS_DIR):
             folder_path = os.path.join(SCREENSHOTS_DIR, folder)
-            if os.path.isdir(folder_path) and folder != today:
+            if not os.path.isdir(folder_path) or folder == today:
+                continue
+            # Any file left is still queued (or dead-lettered) - the backlog uploads it later
+            if not any(files for _, _, files in os.walk(folder_path)):
                 try:
                     import shutil
                     shutil.rmtree(folder_path)
@@ -1524,6 +1543,8 @@ class Dashboard(QWidget):
         if self.capturing:
             self.task.check_out()
             self.dash_page.clock_out()
+        if self.activity:
+            self.activity.stop()
         self.sync.stop_sync()
         self.cleanup.stop()
         
@@ -2321,6 +2342,8 @@ class MainWindow(QMainWindow):
         self.ss = ScreenshotService()
         self.sync = SyncManager(self.auth)
         self.cleanup = CleanupManager()
+        self.activity = ActivityTracker(self.auth)
+        self.ss.window_source = self.activity.latest_window  # Share window samples instead of probing twice
         self.task = TaskManager(self.auth)
         
         # Notification Manager
@@ -2335,29 +2358,24 @@ class MainWindow(QMainWindow):
     
     def load_window_size(self):
         """Load saved window size from config"""
-        from config import DATA_DIR
-        import json
-        
-        settings_file = os.path.join(DATA_DIR, "window_settings.json")
         try:
-            if os.path.exists(settings_file):
-                with open(settings_file, 'r') as f:
-                    settings = json.load(f)
-                    width = settings.get('width', 900)
-                    height = settings.get('height', 650)
-                    x = settings.get('x')
-                    y = settings.get('y')
-                    
-                    self.resize(width, height)
-                    
-                    if x is not None and y is not None:
-                        self.move(x, y)
-                    else:
-                        # Center on screen
-                        screen = QApplication.desktop().screenGeometry()
-                        x = (screen.width() - width) // 2
-                        y = (screen.height() - height) // 2
-                        self.move(x, y)
+            settings = get_state_file(WINDOW_SETTINGS_FILE).get()
+            if settings:
+                width = settings.get('width', 900)
+                height = settings.get('height', 650)
+                x = settings.get('x')
+                y = settings.get('y')
+                
+                self.resize(width, height)
+                
+                if x is not None and y is not None:
+                    self.move(x, y)
+                else:
+                    # Center on screen
+                    screen = QApplication.desktop().screenGeometry()
+                    x = (screen.width() - width) // 2
+                    y = (screen.height() - height) // 2
+                    self.move(x, y)
             else:
                 # Default size - wider for chat
                 self.resize(900, 650)
@@ -2371,11 +2389,7 @@ class MainWindow(QMainWindow):
             self.resize(900, 650)
     
     def save_window_size(self):
-        """Save current window size to config"""
-        from config import DATA_DIR
-        import json
-        
-        settings_file = os.path.join(DATA_DIR, "window_settings.json")
+        """Save current window size to config - written in the background"""
         try:
             settings = {
                 'width': self.width(),
@@ -2383,8 +2397,7 @@ class MainWindow(QMainWindow):
                 'x': self.x(),
                 'y': self.y()
             }
-            with open(settings_file, 'w') as f:
-                json.dump(settings, f)
+            get_state_file(WINDOW_SETTINGS_FILE).set(settings)
         except Exception as e:
             print(f"Error saving window size: {e}")
 
@@ -2413,7 +2426,7 @@ class MainWindow(QMainWindow):
         self.login.login_success.connect(self.on_login_success)
         self.stack.addWidget(self.login)
 
-        self.dash = Dashboard(self.auth, self.ss, self.sync, self.cleanup, self.task, self.signals, self.notification_manager)
+        self.dash = Dashboard(self.auth, self.ss, self.sync, self.cleanup, self.task, self.signals, self.notification_manager, self.activity)
         self.dash.logout_signal.connect(self.show_login)
         self.stack.addWidget(self.dash)
         
@@ -2501,6 +2514,7 @@ class MainWindow(QMainWindow):
         if self.dash.capturing:
             self.task.check_out()
         self.ss.stop()
+        self.activity.stop()
         self.sync.stop_sync()
         self.cleanup.stop()
         self.close()
@@ -2550,27 +2564,16 @@ class MainWindow(QMainWindow):
     
     def should_show_tc(self):
         """Check if T&C has been accepted"""
-        import json
-        from config import TC_ACCEPTANCE_FILE
-        
-        try:
-            if os.path.exists(TC_ACCEPTANCE_FILE):
-                with open(TC_ACCEPTANCE_FILE, 'r') as f:
-                    data = json.load(f)
-                    return not data.get('accepted', False)
-        except:
-            pass
+        data = get_state_file(TC_ACCEPTANCE_FILE).get()
+        if isinstance(data, dict):
+            return not data.get('accepted', False)
         return True
     
     def save_tc_acceptance(self):
         """Save T&C acceptance"""
-        import json
-        from config import TC_ACCEPTANCE_FILE
-        
         try:
             data = {'accepted': True}
-            with open(TC_ACCEPTANCE_FILE, 'w') as f:
-                json.dump(data, f)
+            get_state_file(TC_ACCEPTANCE_FILE).set(data)
         except Exception as e:
             print(f"Error saving T&C acceptance: {e}")
     
@@ -2662,4 +2665,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Required for the encoder process pool in frozen (PyInstaller) builds
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
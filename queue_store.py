@@ -0,0 +1,306 @@
+# queue_store.py - Durable SQLite Upload Queue
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+from config import UPLOAD_QUEUE_DB, UPLOAD_QUEUE_FILE, QUEUE_UPLOADED_RETENTION, CONTENT_INDEX_RETENTION
+from debug_logger import log_sync
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+DEAD = 'dead'  # Gave up after too many attempts - kept for inspection and replay
+COMPACTED = 'compacted'  # Thinned out of the backlog - the item records which frame stands in
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT NOT NULL UNIQUE,
+    item TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_state ON queue (state, id);
+CREATE TABLE IF NOT EXISTS content_index (
+    sha256 TEXT PRIMARY KEY,
+    uploaded_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release: name -> definition
+COLUMNS = {
+    'upload_id': 'TEXT',  # Resumable upload session on the server
+    'upload_offset': 'INTEGER NOT NULL DEFAULT 0',  # Bytes the server has acknowledged
+    'attempts': 'INTEGER NOT NULL DEFAULT 0',  # Failed upload attempts so far
+    'next_attempt_at': 'REAL NOT NULL DEFAULT 0',  # Not retried before this time.time()
+}
+
+
+class QueueStore:
+    """Transactional upload queue with per-item states"""
+
+    def __init__(self, db_path=UPLOAD_QUEUE_DB, legacy_json=UPLOAD_QUEUE_FILE):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_columns()
+        # Anything left in flight by a crash goes back to pending
+        self._execute("UPDATE queue SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT))
+        if legacy_json:
+            self.migrate_json(legacy_json)
+
+    def _add_columns(self):
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(queue)")}
+        for name, definition in COLUMNS.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE queue ADD COLUMN {name} {definition}")
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Hold the lock for one transaction - committed on success, rolled back on any error"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def enqueue(self, items):
+        """Add queue items (dicts with file_path) - known paths are ignored"""
+        now = time.time()
+        rows = [(item['file_path'], json.dumps(item), PENDING, now, now) for item in items]
+        with self._transaction() as conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO queue (file_path, item, state, enqueued_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return cursor.rowcount
+
+    def pending_items(self):
+        """All items waiting for upload, oldest first"""
+        rows = self._execute(
+            "SELECT item FROM queue WHERE state IN (?, ?) ORDER BY id", (PENDING, FAILED)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def set_state(self, file_path, state):
+        self._execute(
+            "UPDATE queue SET state = ?, updated_at = ? WHERE file_path = ?",
+            (state, time.time(), file_path)
+        )
+
+    def mark_uploaded(self, file_paths):
+        """Mark a set of paths uploaded in one transaction"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO queue (file_path, item, state, enqueued_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(file_path) DO UPDATE SET "
+                "state = excluded.state, updated_at = excluded.updated_at, "
+                "upload_id = NULL, upload_offset = 0, attempts = 0, next_attempt_at = 0",
+                [(path, json.dumps({'file_path': path}), UPLOADED, now, now) for path in file_paths]
+            )
+
+    def record_failure(self, file_path):
+        """Count a failed attempt - returns the attempts so far"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE queue SET state = ?, attempts = attempts + 1, updated_at = ? WHERE file_path = ?",
+                (FAILED, time.time(), file_path)
+            )
+            row = conn.execute("SELECT attempts FROM queue WHERE file_path = ?", (file_path,)).fetchone()
+        return row[0] if row else 0
+
+    def schedule_retry(self, file_path, next_attempt_at):
+        self._execute("UPDATE queue SET next_attempt_at = ? WHERE file_path = ?", (next_attempt_at, file_path))
+
+    def retry_schedule(self):
+        """{file_path: next_attempt_at} for failed items still backing off"""
+        rows = self._execute(
+            "SELECT file_path, next_attempt_at FROM queue WHERE state = ? AND next_attempt_at > ?",
+            (FAILED, time.time())
+        ).fetchall()
+        return dict(rows)
+
+    def dead_items(self):
+        """Dead-lettered items as dicts with file_path, attempts and updated_at"""
+        rows = self._execute(
+            "SELECT item, attempts, updated_at FROM queue WHERE state = ? ORDER BY id", (DEAD,)
+        ).fetchall()
+        return [{**json.loads(item), 'attempts': attempts, 'updated_at': updated_at}
+                for item, attempts, updated_at in rows]
+
+    def replay_dead(self, file_paths=None):
+        """Move dead-lettered items (all, or the given paths) back to pending - returns the items"""
+        wanted = None if file_paths is None else set(file_paths)
+        items = [item for item in self.dead_items() if wanted is None or item['file_path'] in wanted]
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE queue SET state = ?, attempts = 0, next_attempt_at = 0, updated_at = ? "
+                "WHERE file_path = ? AND state = ?",
+                [(PENDING, time.time(), item['file_path'], DEAD) for item in items]
+            )
+        for item in items:
+            del item['attempts'], item['updated_at']
+        return items
+
+    def remember_hashes(self, hashes):
+        """Record content hashes the server now has"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO content_index (sha256, uploaded_at) VALUES (?, ?)",
+                [(h, now) for h in hashes]
+            )
+
+    def known_hashes(self, hashes):
+        """The subset of hashes already uploaded from this machine"""
+        hashes = list(hashes)
+        known = set()
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self._execute(f"SELECT sha256 FROM content_index WHERE sha256 IN ({placeholders})", chunk)
+            known.update(row[0] for row in rows.fetchall())
+        return known
+
+    def update_items(self, items):
+        """Rewrite stored items (e.g. with compaction records), keeping their state"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE queue SET item = ?, updated_at = ? WHERE file_path = ?",
+                [(json.dumps(item), time.time(), item['file_path']) for item in items]
+            )
+
+    def mark_compacted(self, items):
+        """Record items dropped by backlog compaction"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE queue SET item = ?, state = ?, updated_at = ? WHERE file_path = ?",
+                [(json.dumps(item), COMPACTED, time.time(), item['file_path']) for item in items]
+            )
+
+    def set_progress(self, file_path, upload_id, offset):
+        """Persist a resumable upload's session id and acknowledged offset"""
+        self._execute(
+            "UPDATE queue SET upload_id = ?, upload_offset = ?, updated_at = ? WHERE file_path = ?",
+            (upload_id, offset, time.time(), file_path)
+        )
+
+    def progress_of(self, file_path):
+        """(upload_id, offset) of an interrupted resumable upload, or (None, 0)"""
+        row = self._execute(
+            "SELECT upload_id, upload_offset FROM queue WHERE file_path = ?", (file_path,)
+        ).fetchone()
+        return (row[0], row[1]) if row and row[0] else (None, 0)
+
+    def state_of(self, file_path):
+        row = self._execute("SELECT state FROM queue WHERE file_path = ?", (file_path,)).fetchone()
+        return row[0] if row else None
+
+    def paths_in_state(self, state):
+        rows = self._execute("SELECT file_path FROM queue WHERE state = ?", (state,)).fetchall()
+        return {row[0] for row in rows}
+
+    def is_uploaded(self, file_path):
+        return self.state_of(file_path) == UPLOADED
+
+    def latest_in_folder(self, folder):
+        """Most recently queued frame (not an unchanged marker) under `folder` - None if there is none"""
+        rows = self._execute(
+            "SELECT item FROM queue WHERE file_path > ? AND file_path < ? ORDER BY id DESC LIMIT 50",
+            (folder + os.sep, folder + chr(ord(os.sep) + 1))
+        ).fetchall()
+        for row in rows:
+            item = json.loads(row[0])
+            if not item.get('unchanged'):
+                return item
+        return None
+
+    def is_known(self, file_path):
+        """Whether the store has any record of the path - uploaded, dead, compacted or still queued"""
+        return self.state_of(file_path) is not None
+
+    def count(self, *states):
+        placeholders = ', '.join('?' for _ in states)
+        row = self._execute(f"SELECT COUNT(*) FROM queue WHERE state IN ({placeholders})", states).fetchone()
+        return row[0]
+
+    def prune_uploaded(self, keep=QUEUE_UPLOADED_RETENTION):
+        """Keep only the most recent `keep` uploaded (and compacted) records"""
+        for state in (UPLOADED, COMPACTED):
+            self._execute(
+                "DELETE FROM queue WHERE state = ? AND id NOT IN "
+                "(SELECT id FROM queue WHERE state = ? ORDER BY id DESC LIMIT ?)",
+                (state, state, keep)
+            )
+        self._execute(
+            "DELETE FROM content_index WHERE sha256 NOT IN "
+            "(SELECT sha256 FROM content_index ORDER BY uploaded_at DESC LIMIT ?)",
+            (CONTENT_INDEX_RETENTION,)
+        )
+
+    def migrate_json(self, json_path):
+        """One-time import of the old upload_queue.json (list or dict format)"""
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            log_sync(f"Could not read legacy queue {json_path}: {e}", 'warning')
+            data = []
+
+        # Old format: list of paths/items; newer format: {'pending': [...], 'uploaded': [...]}
+        if isinstance(data, list):
+            pending, uploaded = data, []
+        else:
+            pending, uploaded = data.get('pending', []), data.get('uploaded', [])
+
+        items = []
+        for entry in pending:
+            if isinstance(entry, dict) and entry.get('file_path'):
+                items.append(entry)
+            elif isinstance(entry, str):
+                items.append({'file_path': entry, 'url_data': {}})
+        self.mark_uploaded([path for path in uploaded if isinstance(path, str)])
+        self.enqueue(items)
+        self.prune_uploaded()
+
+        os.replace(json_path, json_path + '.migrated')
+        log_sync(f"Migrated legacy queue: {len(items)} pending, {len(uploaded)} uploaded")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == '__main__':
+    # Dead-letter inspection: python queue_store.py dead | replay [file_path ...]
+    if len(sys.argv) < 2 or sys.argv[1] not in ('dead', 'replay'):
+        print("Usage: python queue_store.py dead | replay [file_path ...]")
+        sys.exit(1)
+    store = QueueStore(legacy_json=None)
+    if sys.argv[1] == 'dead':
+        for item in store.dead_items():
+            updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['updated_at']))
+            print(f"{item['attempts']:>3} attempts   last {updated}   {item['file_path']}")
+    else:
+        replayed = store.replay_dead(sys.argv[2:] or None)
+        # A running app keeps its own in-memory queue - it only reads the store at startup
+        print(f"Replayed {len(replayed)} item(s) - restart the app to upload them")
+    store.close()
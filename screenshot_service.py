@@ -2,14 +2,29 @@
 
 import os
 import datetime
+import functools
+import random
 import threading
 import time
 from mss import mss
 from mss.exception import ScreenShotError
-from PIL import Image
-from config import SCREENSHOTS_DIR, SCREENSHOT_INTERVAL, IMAGE_QUALITY, IMAGE_FORMAT
+from config import (
+    SCREENSHOTS_DIR, SCREENSHOT_INTERVAL, SCREENSHOT_JITTER,
+    SCREENSHOT_SINGLE_GRAB, IMAGE_FORMAT, CHANGE_DETECTION_ENABLED, DELTA_FRAMES_ENABLED
+)
+from change_detector import ChangeDetector
+from frame_encoder import FrameEncoderPool
+from encoding_policy import EncodingPolicy
+from frame_delta import KeyframeTracker
 from debug_logger import log_screenshot
 
+# NumPy is needed to slice monitors out of a single desktop grab
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # Import lightweight browser monitor (no heavy dependencies!)
 try:
     from browser_monitor import get_browser_monitor
@@ -21,13 +36,89 @@ except ImportError:
     log_screenshot("⚠️  Browser Monitor not available", 'warning')
 
 
+class CaptureScheduler:
+    """Fixed-cadence capture deadlines on the monotonic clock"""
+
+    def __init__(self, interval, jitter=0.0):
+        self.interval = interval
+        # Keep jitter well inside the interval so slots never swap order
+        self.jitter = min(max(0.0, jitter), interval / 4)
+        self.stop_event = threading.Event()
+        self.deadline = None
+        self.overrun_count = 0
+
+    def start(self):
+        """Reset the schedule - the first round runs immediately"""
+        self.stop_event.clear()
+        self.deadline = None
+
+    def stop(self):
+        """Wake any waiting capture loop"""
+        self.stop_event.set()
+
+    def wait(self):
+        """Block until the next capture slot - returns False once stopped"""
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+            return not self.stop_event.is_set()
+
+        self.deadline += self.interval
+        if now > self.deadline:
+            # Capture took longer than the interval - skip the missed slots
+            missed = int((now - self.deadline) // self.interval) + 1
+            self.overrun_count += 1
+            log_screenshot(
+                f"Capture overran interval by {now - self.deadline:.1f}s - "
+                f"skipping {missed} slot(s)", 'warning'
+            )
+            self.deadline += missed * self.interval
+
+        # Jitter each slot around the fixed deadline so agents don't upload in lockstep
+        target = self.deadline + random.uniform(-self.jitter, self.jitter)
+        return not self.stop_event.wait(max(0.0, target - now))
+
+
+class CaptureRound:
+    """Collects the frames of one capture round until all encodes finish"""
+
+    def __init__(self, on_complete):
+        self.items = []
+        self.outstanding = 1  # Held by the grab loop until every monitor is submitted
+        self.lock = threading.Lock()
+        self.on_complete = on_complete
+
+    def add(self, item):
+        with self.lock:
+            self.items.append(item)
+
+    def expect(self):
+        with self.lock:
+            self.outstanding += 1
+
+    def done(self):
+        with self.lock:
+            self.outstanding -= 1
+            finished = self.outstanding == 0
+        if finished:
+            self.on_complete(self.items)
+
+
 class ScreenshotService:
     def __init__(self, on_capture_callback=None):
         self.is_running = False
         self.thread = None
         self.screen_map = {}
         self.on_capture_callback = on_capture_callback
+        self.window_source = None  # Returns a recent (window info, url data) sample from another service, or None
         self.captured_files = []  # Track captured files for upload queue
+        self.change_detector = ChangeDetector() if CHANGE_DETECTION_ENABLED else None
+        self.unchanged_count = 0  # Frames skipped because the screen did not change
+        self.encoder = FrameEncoderPool()
+        self.encoding_policy = EncodingPolicy()
+        self.keyframes = KeyframeTracker() if DELTA_FRAMES_ENABLED else None
+        self.single_grab_active = False
+        self.scheduler = CaptureScheduler(SCREENSHOT_INTERVAL, SCREENSHOT_JITTER)
 
     def start(self):
         """Start the screenshot capture loop"""
@@ -36,10 +127,11 @@ class ScreenshotService:
             return
         
         log_screenshot("🚀 Starting screenshot capture service...")
-        log_screenshot(f"Interval: {SCREENSHOT_INTERVAL} seconds")
+        log_screenshot(f"Interval: {SCREENSHOT_INTERVAL} seconds (±{SCREENSHOT_JITTER}s jitter)")
         log_screenshot(f"Save directory: {SCREENSHOTS_DIR}")
         
         self.is_running = True
+        self.encoder.start()
         self.thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.thread.start()
         log_screenshot("✅ Screenshot service started successfully")
@@ -52,9 +144,11 @@ class ScreenshotService:
             
         log_screenshot("🛑 Stopping screenshot capture service...")
         self.is_running = False
+        self.scheduler.stop()  # Wakes the capture loop immediately
         if self.thread:
             self.thread.join(timeout=2)
             self.thread = None
+        self.encoder.shutdown(wait=False)
         log_screenshot("✅ Screenshot service stopped")
 
     def _capture_loop(self):
@@ -62,8 +156,9 @@ class ScreenshotService:
         log_screenshot("📸 Capture loop started")
         capture_count = 0
         
+        self.scheduler.start()
         with mss() as sct:
-            while self.is_running:
+            while self.is_running and self.scheduler.wait():
                 try:
                     capture_count += 1
                     log_screenshot(f"Capture #{capture_count} starting...")
@@ -73,12 +168,6 @@ class ScreenshotService:
                     log_screenshot(f"Capture error: {e}", 'error')
                     import traceback
                     log_screenshot(traceback.format_exc(), 'error')
-                
-                # Sleep in small intervals to allow quick stop
-                for _ in range(SCREENSHOT_INTERVAL):
-                    if not self.is_running:
-                        break
-                    time.sleep(1)
         
         log_screenshot("📸 Capture loop ended")
 
@@ -104,48 +193,182 @@ class ScreenshotService:
         # Remove disconnected screens
         removed_hashes = [h for h in self.screen_map if h not in current_hashes]
         for h in removed_hashes:
-            del self.screen_map[h]
-
-        # Capture each screen
-        captured_this_round = []
-        for mon_idx, (mon, mon_hash) in enumerate(zip(monitors, current_hashes), 1):
-            folder_name = self.screen_map[mon_hash]
-            screen_folder = os.path.join(date_folder, folder_name)
-            os.makedirs(screen_folder, exist_ok=True)
-
-            try:
-                log_screenshot(f"Capturing monitor {mon_idx}/{len(monitors)} ({folder_name})...")
-                shot = sct.grab(mon)
-                img = Image.frombytes("RGB", shot.size, shot.rgb)
-                
-                # Detect URL from browser history (lightweight, no OCR!)
-                url_data = self._detect_url_from_browser()
-                if url_data.get('is_browser_active'):
-                    log_screenshot(f"URL detected: {url_data.get('detected_url', 'N/A')}")
-                else:
-                    log_screenshot("No active browser URL detected")
+            folder_name = self.screen_map.pop(h)
+            self.encoding_policy.forget(folder_name)
+            if self.keyframes:
+                self.keyframes.forget(folder_name)
+            if self.change_detector:
+                self.change_detector.forget(h)
+
+        # Grab the whole virtual desktop once when the layout allows it
+        desktop = self._grab_desktop(sct, monitors) if SCREENSHOT_SINGLE_GRAB else None
+
+        # Capture each screen - encoding happens on the encoder pool
+        capture_round = CaptureRound(self._finish_round)
+        url_data = None  # Resolved lazily, only if some screen changed
+        try:
+            for mon_idx, (mon, mon_hash) in enumerate(zip(monitors, current_hashes), 1):
+                folder_name = self.screen_map[mon_hash]
+                screen_folder = os.path.join(date_folder, folder_name)
+                os.makedirs(screen_folder, exist_ok=True)
+
+                try:
+                    log_screenshot(f"Capturing monitor {mon_idx}/{len(monitors)} ({folder_name})...")
+                    if desktop:
+                        raw, size = self._slice_monitor(desktop, mon)
+                        grab_ms = desktop['grab_ms']
+                    else:
+                        grab_started = time.perf_counter()
+                        shot = sct.grab(mon)
+                        raw, size = shot.raw, shot.size
+                        grab_ms = round((time.perf_counter() - grab_started) * 1000, 1)
+
+                    # Skip encoding/uploading if the screen has not changed
+                    if self.change_detector:
+                        changed, ratio = self.change_detector.check(mon_hash, raw, size)
+                        if not changed:
+                            self.unchanged_count += 1
+                            log_screenshot(f"Screen unchanged ({ratio:.2%} differs) - skipping {folder_name}")
+                            capture_round.add({
+                                'file_path': None,
+                                'screen': folder_name,
+                                'screen_folder': screen_folder,
+                                'unchanged': True,
+                                'change_ratio': ratio,
+                                'captured_at': time.time()
+                            })
+                            continue
                 
-                timestamp = datetime.datetime.now().strftime("%H-%M-%S")
-                file_path = os.path.join(screen_folder, f"{timestamp}.webp")
-                img.save(file_path, IMAGE_FORMAT, quality=IMAGE_QUALITY, method=6)
-                log_screenshot(f"✅ Screenshot saved: {file_path}")
+                    # Detect URL once per round - every screen shares the same active window
+                    if url_data is None:
+                        url_data = self._detect_url_from_browser()
+                        if url_data.get('is_browser_active'):
+                            log_screenshot(f"URL detected: {url_data.get('detected_url', 'N/A')}")
+                        else:
+                            log_screenshot("No active browser URL detected")
                 
-                # Store with URL metadata
-                captured_this_round.append({
-                    'file_path': file_path,
-                    'url_data': url_data
-                })
-                self.captured_files.append({
-                    'file_path': file_path,
-                    'url_data': url_data
-                })
+                    # Backpressure - drop or downgrade when encoders fall behind
+                    plan = self.encoding_policy.plan(folder_name, size)
+                    method = self.encoder.admit(plan['method'])
+                    if method is None:
+                        log_screenshot(f"Encoders busy - dropping frame for {folder_name}", 'warning')
+                        if self.change_detector:
+                            self.change_detector.rollback(mon_hash)
+                        continue
+                    if method != plan['method']:
+                        log_screenshot(f"Encoders busy - downgrading {folder_name} to method={method}", 'warning')
+                        plan['method'] = method
+                    if self.keyframes:
+                        plan['delta'] = self.keyframes.plan_for(folder_name)
+
+                    timestamp = datetime.datetime.now().strftime("%H-%M-%S")
+                    file_path = os.path.join(screen_folder, f"{timestamp}.webp")
+                    item = {
+                        'file_path': file_path,
+                        'screen': folder_name,
+                        'url_data': dict(url_data),
+                        'timings': {'grab_ms': grab_ms}
+                    }
+                    capture_round.expect()
+                    on_done = functools.partial(self._on_frame_encoded, capture_round, item, time.time(), mon_hash)
+                    self.encoder.submit(
+                        on_done, raw, size, file_path, IMAGE_FORMAT, plan
+                    )
                 
-            except ScreenShotError as e:
-                log_screenshot(f"Could not capture {folder_name}: {e}", 'error')
+                except ScreenShotError as e:
+                    log_screenshot(f"Could not capture {folder_name}: {e}", 'error')
+
+        finally:
+            # Release the grab loop's hold - callback fires once all encodes finish
+            capture_round.done()
+
+    def _grab_desktop(self, sct, monitors):
+        """Grab all monitors in one call - None if the layout needs per-monitor grabs"""
+        virtual = sct.monitors[0]
+        use_single_grab = NUMPY_AVAILABLE and self._is_rectangular_layout(virtual, monitors)
+        if use_single_grab != self.single_grab_active:
+            self.single_grab_active = use_single_grab
+            mode = "single desktop grab" if use_single_grab else "per-monitor grabs"
+            log_screenshot(f"Capture mode: {mode}")
+        if not use_single_grab:
+            return None
+
+        grab_started = time.perf_counter()
+        try:
+            shot = sct.grab(virtual)
+        except ScreenShotError as e:
+            log_screenshot(f"Desktop grab failed, using per-monitor grabs: {e}", 'warning')
+            return None
+        grab_ms = round((time.perf_counter() - grab_started) * 1000, 1)
+        width, height = shot.size
+        return {
+            'frame': np.frombuffer(shot.raw, dtype=np.uint8).reshape(height, width, 4),
+            'left': virtual['left'],
+            'top': virtual['top'],
+            'grab_ms': grab_ms
+        }
+
+    def _is_rectangular_layout(self, virtual, monitors):
+        """True if the monitors exactly tile the virtual desktop rectangle"""
+        covered = 0
+        for mon in monitors:
+            if (mon['left'] < virtual['left'] or mon['top'] < virtual['top'] or
+                    mon['left'] + mon['width'] > virtual['left'] + virtual['width'] or
+                    mon['top'] + mon['height'] > virtual['top'] + virtual['height']):
+                return False
+            covered += mon['width'] * mon['height']
+        # Gaps (or mirrored/overlapping screens) would waste or duplicate pixels
+        return covered == virtual['width'] * virtual['height']
 
-        # Notify callback
-        if self.on_capture_callback and captured_this_round:
-            self.on_capture_callback(captured_this_round)
+    def _slice_monitor(self, desktop, mon):
+        """Cut one monitor's region out of the desktop frame"""
+        x = mon['left'] - desktop['left']
+        y = mon['top'] - desktop['top']
+        region = desktop['frame'][y:y + mon['height'], x:x + mon['width']]
+        # Encoders need a contiguous BGRA buffer - this is the only copy made
+        return np.ascontiguousarray(region).reshape(-1), (mon['width'], mon['height'])
+
+    def _on_frame_encoded(self, capture_round, item, submitted_at, change_key, result, error):
+        """Encoder completion - runs on the pool's callback thread"""
+        try:
+            if error is not None:
+                log_screenshot(f"Encode failed for {item['file_path']}: {error}", 'error')
+                if self.change_detector:
+                    self.change_detector.rollback(change_key)
+                return
+            if self.change_detector:
+                self.change_detector.commit(change_key)  # Saved - the new reference for this screen
+
+            item['timings'].update({
+                'queue_ms': round(max(0.0, result['started_at'] - submitted_at) * 1000, 1),
+                'convert_ms': result['convert_ms'],
+                'encode_ms': result['encode_ms']
+            })
+            # Delta frames are written under their own name
+            item['file_path'] = result['file_path']
+            item['size_bytes'] = result['bytes']
+            if result['frame']:
+                item['frame_type'] = result['frame']['frame_type']
+                self.keyframes.record(item['screen'], result['file_path'], result['frame'])
+            item['encoding'] = result['encoding']
+            self.encoding_policy.record(item['screen'], result['encoding']['quality'], result['bytes'])
+            log_screenshot(
+                f"✅ Screenshot saved: {item['file_path']} ({result['bytes'] // 1024} KB, "
+                f"q={result['encoding']['quality']}, m={result['encoding']['method']}) {item['timings']}"
+            )
+
+            capture_round.add(item)
+            self.captured_files.append({
+                'file_path': item['file_path'],
+                'url_data': item['url_data']
+            })
+        finally:
+            capture_round.done()
+
+    def _finish_round(self, items):
+        """Notify callback with every frame of a completed round"""
+        if self.on_capture_callback and items:
+            self.on_capture_callback(items)
     
     def _detect_url_from_browser(self):
         """Detect current URL from browser window title (lightweight!)"""
@@ -153,19 +376,24 @@ class ScreenshotService:
             return {'is_browser_active': False}
         
         try:
-            # Get active window info
-            window_monitor = get_window_monitor()
-            window_info = window_monitor.get_active_window_info()
-            
-            if not window_info:
-                return {'is_browser_active': False}
-            
-            # Pass window title and process to browser monitor
-            browser_monitor = get_browser_monitor()
-            url_data = browser_monitor.get_active_browser_url(
-                window_info.get('title', ''),
-                window_info.get('process', '')
-            )
+            # Reuse the activity tracker's latest sample - probing again costs a subprocess on some platforms
+            sample = self.window_source() if self.window_source else None
+            if sample:
+                window_info, url_data = sample
+            else:
+                # Get active window info
+                window_monitor = get_window_monitor()
+                window_info = window_monitor.get_active_window_info()
+
+                if not window_info:
+                    return {'is_browser_active': False}
+
+                # Pass window title and process to browser monitor
+                browser_monitor = get_browser_monitor()
+                url_data = browser_monitor.get_active_browser_url(
+                    window_info.get('title', ''),
+                    window_info.get('process', '')
+                )
             
             if url_data:
                 return {
@@ -0,0 +1,134 @@
+# state_store.py - Atomic, debounced persistence for small JSON state files
+
+import os
+import copy
+import json
+import time
+import atexit
+import threading
+from config import STATE_SAVE_DEBOUNCE
+from debug_logger import log_main
+
+
+class StateFile:
+    """One JSON document kept in memory and written to disk off the caller's thread"""
+
+    def __init__(self, path, debounce=STATE_SAVE_DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # One writer of the temp file at a time
+        self.version = 0  # Bumped on every change
+        self.saved_version = 0
+        self.data = self._read()
+
+    def get(self, default=None):
+        """Current document (a copy) - never touches the disk"""
+        with self.lock:
+            data = self.data
+        return copy.deepcopy(data) if data is not None else default
+
+    def set(self, data):
+        """Replace the document - written within `debounce` seconds"""
+        data = copy.deepcopy(data)
+        with self.lock:
+            if data == self.data:
+                return  # Unchanged - nothing to write
+            self.data = data
+            self.version += 1
+        _writer.schedule(self)
+
+    def delete(self):
+        """Forget the document and remove its file"""
+        self.set(None)
+
+    def flush(self):
+        """Write pending changes now, on the calling thread"""
+        with self.write_lock:
+            self._write()
+
+    def _write(self):
+        with self.lock:
+            if self.version == self.saved_version:
+                return
+            data, version = self.data, self.version
+        try:
+            if data is None:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)  # Readers see the old or the new file, never half of one
+        except OSError as e:
+            log_main(f"Saving {os.path.basename(self.path)} failed: {e}", 'error')
+            _writer.schedule(self)  # Try again after the next debounce
+            return
+        with self.lock:
+            self.saved_version = max(self.saved_version, version)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            log_main(f"Reading {os.path.basename(self.path)} failed: {e}", 'error')
+            return None
+
+
+class StateWriter:
+    """Single background thread flushing state files once their debounce expires"""
+
+    def __init__(self):
+        self.due = {}  # StateFile -> time.monotonic() to write at
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def schedule(self, state):
+        with self.cond:
+            # Keep the first deadline - a stream of changes still gets written
+            self.due.setdefault(state, time.monotonic() + state.debounce)
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, daemon=True, name='state-writer')
+                self.thread.start()
+            self.cond.notify()
+
+    def flush_all(self):
+        with self.cond:
+            states = list(self.due)
+            self.due.clear()
+        for state in states:
+            state.flush()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                ready = [state for state, due in self.due.items() if due <= now]
+                if not ready:
+                    self.cond.wait(min(self.due.values()) - now if self.due else None)
+                    continue
+                for state in ready:
+                    del self.due[state]
+            for state in ready:
+                state.flush()
+
+
+_writer = StateWriter()
+atexit.register(_writer.flush_all)  # Don't lose the last debounce window on exit
+
+# One StateFile per path, shared by every reader and writer
+_state_files = {}
+_state_files_lock = threading.Lock()
+
+def get_state_file(path):
+    """Get or create the shared state file for `path`"""
+    with _state_files_lock:
+        if path not in _state_files:
+            _state_files[path] = StateFile(path)
+        return _state_files[path]
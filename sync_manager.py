@@ -2,141 +2,344 @@
 
 import os
 import json
+import math
 import threading
 import time
+import heapq
+import random
+import hashlib
+import itertools
+from collections import OrderedDict
 import requests
-from config import UPLOAD_QUEUE_FILE, API_SCREENSHOT_UPLOAD_URL, SCREENSHOTS_DIR, API_SYNC_STATUS_URL
+from config import (
+    API_SCREENSHOT_UPLOAD_URL, API_SCREENSHOT_BUNDLE_URL, API_UPLOAD_SESSIONS_URL, SCREENSHOTS_DIR,
+    API_SYNC_STATUS_URL, API_SYNC_CHECK_URL, SYNC_CHECK_BATCH_SIZE, UPLOAD_BATCH_SIZE,
+    API_SCREENSHOT_PREFLIGHT_URL, API_SCREENSHOT_REFERENCE_URL, UPLOAD_DEDUP_ENABLED, UPLOAD_BUNDLE_ENABLED, UPLOAD_BUNDLE_SIZE,
+    UPLOAD_RESUMABLE_ENABLED, UPLOAD_CHUNK_THRESHOLD, UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_RETRIES,
+    UPLOAD_MAX_ATTEMPTS, UPLOAD_RETRY_BASE_DELAY, UPLOAD_RETRY_MAX_DELAY,
+    UPLOAD_FRESH_WINDOW, UPLOAD_BACKLOG_SHARE, COMPACTION_ENABLED, COMPACTION_INTERVAL
+)
+from debug_logger import log_sync
+from frame_delta import is_delta_file, load_manifest
+from queue_store import QueueStore, IN_FLIGHT, FAILED, UPLOADED, DEAD
+from upload_engine import get_upload_engine
+from api_client import get_api_client, ENDPOINT_UNSUPPORTED_STATUSES
+from connectivity import get_connectivity_monitor
+from compaction import BacklogCompactor
+
+# Upload outcome besides True/False: throttled, server outage or network failure -
+# says nothing about the file, so it is retried without counting an attempt
+TRANSIENT = 'transient'
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+
+
+def path_digest(rel_path):
+    """Compact digest of a relative path for sync checks (16 hex chars)"""
+    return hashlib.blake2b(rel_path.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def file_sha256(file_path):
+    """Hex SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadQueue:
+    """Pending uploads in two lanes with an O(1) path index
+    
+    Fresh captures go newest-first so live monitoring resumes at once; the older
+    backlog drains oldest-first with a guaranteed share of every batch. Items
+    backing off after a failure wait in a heap until they are eligible again.
+    """
+
+    def __init__(self, items=(), fresh_window=UPLOAD_FRESH_WINDOW, backlog_share=UPLOAD_BACKLOG_SHARE):
+        self.fresh_window = fresh_window
+        self.backlog_share = backlog_share
+        self.fresh = OrderedDict()  # file_path -> queue item, captured recently
+        self.backlog = OrderedDict()  # file_path -> queue item, everything older
+        self.deferred = {}  # file_path -> (eligible_at, item)
+        self.retry_heap = []  # (eligible_at, file_path) - may hold stale entries
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Append an item - returns False if its path is already queued"""
+        file_path = item['file_path']
+        if file_path in self:
+            return False
+        self._lane_for(item)[file_path] = item
+        return True
+
+    def _lane_for(self, item):
+        if item.get('captured_at', 0) >= time.time() - self.fresh_window:
+            return self.fresh
+        return self.backlog
+
+    def remove(self, file_path):
+        item = self.fresh.pop(file_path, None)
+        if item is None:
+            item = self.backlog.pop(file_path, None)
+        if item is None and file_path in self.deferred:
+            item = self.deferred.pop(file_path)[1]
+        return item
+
+    def replace(self, item):
+        """Swap in an updated copy of a queued item, keeping its position"""
+        file_path = item['file_path']
+        for lane in (self.fresh, self.backlog):
+            if file_path in lane:
+                lane[file_path] = item
+                return
+        if file_path in self.deferred:
+            self.deferred[file_path] = (self.deferred[file_path][0], item)
+
+    def defer(self, file_path, eligible_at):
+        """Hold an item back until eligible_at (time.time())"""
+        item = self.remove(file_path)
+        if item is not None:
+            self.deferred[file_path] = (eligible_at, item)
+            heapq.heappush(self.retry_heap, (eligible_at, file_path))
+
+    def release_due(self, now=None):
+        """Move items whose backoff has expired into the backlog lane
+
+        A retried item is never the newest capture, so it rejoins the backlog
+        in captured_at order rather than jumping ahead of fresh frames.
+        """
+        now = now or time.time()
+        while self.retry_heap and self.retry_heap[0][0] <= now:
+            eligible_at, file_path = heapq.heappop(self.retry_heap)
+            entry = self.deferred.get(file_path)
+            if entry and entry[0] == eligible_at:
+                del self.deferred[file_path]
+                self._insert_backlog(entry[1])
+
+    def _insert_backlog(self, item):
+        """Place an item in the backlog ahead of everything captured after it"""
+        captured_at = item.get('captured_at', 0)
+        later = [path for path, queued in self.backlog.items() if queued.get('captured_at', 0) > captured_at]
+        self.backlog[item['file_path']] = item
+        for path in later:
+            self.backlog.move_to_end(path)
+
+    def head(self, count):
+        """The next `count` eligible items without removing them"""
+        self._demote_stale()
+        fresh = list(itertools.islice(reversed(self.fresh.values()), count))
+        backlog = list(itertools.islice(self.backlog.values(), count))
+        # The backlog always gets its share; either lane takes what the other leaves unused
+        backlog_count = min(len(backlog), max(math.ceil(count * self.backlog_share), count - len(fresh)))
+        return fresh[:count - backlog_count] + backlog[:backlog_count]
+
+    def _demote_stale(self):
+        """Fresh items that waited past the window join the backlog"""
+        cutoff = time.time() - self.fresh_window
+        while self.fresh:
+            file_path, item = next(iter(self.fresh.items()))
+            if item.get('captured_at', 0) >= cutoff:
+                break
+            del self.fresh[file_path]
+            self.backlog[file_path] = item  # Newer than anything already in the backlog
+
+    def lane_counts(self):
+        return {'fresh': len(self.fresh), 'backlog': len(self.backlog)}
+
+    def deferred_count(self):
+        return len(self.deferred)
+
+    def __contains__(self, file_path):
+        return file_path in self.fresh or file_path in self.backlog or file_path in self.deferred
+
+    def __iter__(self):
+        items = list(self.fresh.values()) + list(self.backlog.values())
+        return iter(items + [item for _, item in self.deferred.values()])
+
+    def __len__(self):
+        return len(self.fresh) + len(self.backlog) + len(self.deferred)
 
 
 class SyncManager:
-    def __init__(self, auth_manager):
+    def __init__(self, auth_manager, store=None):
         self.auth_manager = auth_manager
-        self.upload_queue = []
-        self.uploaded_files = set()  # Track already uploaded files
+        self.store = store or QueueStore()  # Durable queue - pending/in-flight/uploaded/failed
+        self.upload_queue = UploadQueue()
         self.is_syncing = False
         self.sync_thread = None
         self.on_sync_callback = None
-        self.on_access_denied = None  # Callback when 403 received
-        self.batch_size = 5  # Upload 5 files at a time
-        self.batch_delay = 2  # 2 seconds delay between batches
+        self.batch_size = UPLOAD_BATCH_SIZE  # Files handed to the upload engine per batch
+        self.connectivity = get_connectivity_monitor()  # Online/degraded/offline from real request outcomes
+        self.api = get_api_client()  # Shared session - also dispatches 401 and account-level 403s
+        self.engine = get_upload_engine()  # Concurrent workers, adaptive pacing over the same pool
+        self.bundle_enabled = UPLOAD_BUNDLE_ENABLED  # Several files per request
+        self.bundle_size = max(1, UPLOAD_BUNDLE_SIZE)
+        self.bundle_supported = True  # Cleared if the server rejects the bundle endpoint
+        self.resumable_enabled = UPLOAD_RESUMABLE_ENABLED  # Large files go in resumable chunks
+        self.resumable_supported = True  # Cleared if the server rejects upload sessions
+        self.chunk_size = UPLOAD_CHUNK_SIZE
+        self.reconcile_supported = True  # Cleared if the server lacks the incremental sync check
+        self.dedup_enabled = UPLOAD_DEDUP_ENABLED  # Metadata-only uploads for known content
+        self.dedup_supported = True  # Cleared if the server lacks the preflight endpoint
+        self.compactor = BacklogCompactor() if COMPACTION_ENABLED else None  # Thins an old backlog
+        self.last_frames = {}  # screen folder -> last queued frame, the reference for unchanged markers
+        self.last_compaction = 0
         self.access_denied_flag = False  # Stop syncing if access denied
         self.load_queue()
 
-    def _handle_403(self, response):
-        """Handle 403 response - update auth and notify"""
-        try:
-            data = response.json()
-            error_code = data.get('error_code', 'ACCESS_DENIED')
-            message = data.get('message', 'Access denied')
-            self.auth_manager.handle_access_denied(data)
-            self.access_denied_flag = True
-            if self.on_access_denied:
-                self.on_access_denied(error_code, message)
-            return error_code, message
-        except:
-            self.access_denied_flag = True
-            return 'ACCESS_DENIED', 'Access denied'
-
     def load_queue(self):
-        """Load pending uploads from file"""
-        if os.path.exists(UPLOAD_QUEUE_FILE):
-            try:
-                with open(UPLOAD_QUEUE_FILE, 'r') as f:
-                    data = json.load(f)
-                    # Handle both old (list) and new (dict) format
-                    if isinstance(data, list):
-                        self.upload_queue = data
-                        self.uploaded_files = set()
-                    else:
-                        self.upload_queue = data.get('pending', [])
-                        self.uploaded_files = set(data.get('uploaded', []))
-                
-                # Filter out files that no longer exist
-                # Handle both string paths and dict items
-                filtered_queue = []
-                for item in self.upload_queue:
-                    if isinstance(item, dict):
-                        # New format with metadata
-                        file_path = item.get('file_path', '')
-                        if file_path and os.path.exists(file_path):
-                            filtered_queue.append(item)
-                    elif isinstance(item, str):
-                        # Old format - just file path
-                        if os.path.exists(item):
-                            filtered_queue.append(item)
-                
-                self.upload_queue = filtered_queue
-                self.save_queue()
-            except (json.JSONDecodeError, IOError):
-                self.upload_queue = []
-                self.uploaded_files = set()
-
-    def save_queue(self):
-        """Save pending uploads to file"""
-        data = {
-            'pending': self.upload_queue,
-            'uploaded': list(self.uploaded_files)
-        }
-        with open(UPLOAD_QUEUE_FILE, 'w') as f:
-            json.dump(data, f)
+        """Load pending uploads from the queue store"""
+        self.upload_queue = UploadQueue(self.store.pending_items())
+        for file_path, next_attempt_at in self.store.retry_schedule().items():
+            self.upload_queue.defer(file_path, next_attempt_at)
+        self.store.prune_uploaded()
 
     def scan_local_files(self):
         """Scan local screenshots folder and find files not yet uploaded"""
         if not os.path.exists(SCREENSHOTS_DIR):
             return
         
+        new_items = []
         for root, dirs, files in os.walk(SCREENSHOTS_DIR):
             for file in files:
                 if file.endswith(('.webp', '.png', '.jpg', '.jpeg')):
                     file_path = os.path.join(root, file)
-                    # Check if not already in queue (compare file paths)
-                    existing_paths = [self._get_file_path(q) for q in self.upload_queue]
-                    if file_path not in self.uploaded_files and file_path not in existing_paths:
-                        self.upload_queue.append({'file_path': file_path, 'url_data': {}})
+                    # Check if not already in queue or settled in the store (indexed lookups)
+                    if file_path not in self.upload_queue and not self.store.is_known(file_path):
+                        item = {'file_path': file_path, 'url_data': {}, 'captured_at': os.path.getmtime(file_path)}
+                        self.upload_queue.add(item)
+                        new_items.append(item)
         
-        self.save_queue()
+        self.store.enqueue(new_items)
 
     def sync_with_server(self):
-        """Sync local state with server to know what's already uploaded"""
+        """Ask the server which queued files it already has - cost scales with the queue, not history"""
         headers = self.auth_manager.get_auth_header()
         if not headers:
             return False
+        if not self.upload_queue:
+            return True  # Nothing pending, nothing to reconcile
         
         try:
-            response = requests.get(API_SYNC_STATUS_URL, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                server_paths = set(data.get('uploaded_paths', []))
-                
-                # Mark files as uploaded if server has them
-                for item in list(self.upload_queue):
-                    file_path = self._get_file_path(item)
-                    rel_path = os.path.relpath(file_path, SCREENSHOTS_DIR)
-                    if rel_path in server_paths:
-                        self.uploaded_files.add(file_path)
-                        if item in self.upload_queue:
-                            self.upload_queue.remove(item)
-                
-                self.save_queue()
-                return True
+            already_uploaded = None
+            if self.reconcile_supported:
+                already_uploaded = self._reconcile_pending(headers)
+            if not self.reconcile_supported:
+                already_uploaded = self._reconcile_full(headers)  # Older server
+            if already_uploaded is None:
+                return False
+            
+            # Mark files as uploaded if server has them
+            for file_path in already_uploaded:
+                self.upload_queue.remove(file_path)
+            self.store.mark_uploaded(already_uploaded)
+            return True
         except Exception as e:
-            print(f"Sync status error: {e}")
+            log_sync(f"Sync status error: {e}", 'error')
         return False
 
+    def _reconcile_pending(self, headers):
+        """Send digests of the pending relative paths, get back the ones the server has"""
+        by_digest = {}
+        for item in self.upload_queue:
+            file_path = self._get_file_path(item)
+            by_digest[path_digest(os.path.relpath(file_path, SCREENSHOTS_DIR))] = file_path
+        
+        digests = list(by_digest)
+        already_uploaded = []
+        for start in range(0, len(digests), SYNC_CHECK_BATCH_SIZE):
+            response = self.api.post(
+                API_SYNC_CHECK_URL,
+                headers=headers,
+                json={'digests': digests[start:start + SYNC_CHECK_BATCH_SIZE]}
+            )
+            if self._handle_auth_error(response):
+                return None
+            if response.status_code in ENDPOINT_UNSUPPORTED_STATUSES:
+                log_sync(f"Incremental sync not supported (HTTP {response.status_code}) - using full sync status", 'warning')
+                self.reconcile_supported = False
+                return None
+            if response.status_code != 200:
+                return None
+            already_uploaded.extend(
+                by_digest[d] for d in response.json().get('uploaded', []) if d in by_digest
+            )
+        return already_uploaded
+
+    def _reconcile_full(self, headers):
+        """Legacy: download every uploaded path and match the queue against it"""
+        response = self.api.get(API_SYNC_STATUS_URL, headers=headers)
+        if self._handle_auth_error(response) or response.status_code != 200:
+            return None
+        server_paths = set(response.json().get('uploaded_paths', []))
+        return [
+            self._get_file_path(item) for item in self.upload_queue
+            if os.path.relpath(self._get_file_path(item), SCREENSHOTS_DIR) in server_paths
+        ]
+
     def add_to_queue(self, file_paths):
         """Add files to upload queue - handles both dict and string formats"""
+        new_items = []
         for item in file_paths:
             # Handle new format (dict with file_path and url_data)
             if isinstance(item, dict):
+                if item.get('unchanged'):
+                    item = self._unchanged_marker(item)
+                    if item and item['file_path'] not in self.upload_queue:
+                        self.upload_queue.add(item)
+                        new_items.append(item)
+                    continue
                 file_path = item.get('file_path')
-                if file_path and file_path not in [self._get_file_path(q) for q in self.upload_queue] and os.path.exists(file_path):
-                    self.upload_queue.append(item)
+                if file_path and file_path not in self.upload_queue and os.path.exists(file_path):
+                    item = self._with_content_hash({'captured_at': time.time(), **item})
+                    self.upload_queue.add(item)
+                    new_items.append(item)
+                    self.last_frames[os.path.dirname(file_path)] = item
             # Handle old format (string path)
             else:
-                if item not in [self._get_file_path(q) for q in self.upload_queue] and os.path.exists(item):
-                    self.upload_queue.append({'file_path': item, 'url_data': {}})
-        self.save_queue()
+                if item not in self.upload_queue and os.path.exists(item):
+                    new_item = self._with_content_hash(
+                        {'file_path': item, 'url_data': {}, 'captured_at': os.path.getmtime(item)}
+                    )
+                    self.upload_queue.add(new_item)
+                    new_items.append(new_item)
+        self.store.enqueue(new_items)
     
+    def _unchanged_marker(self, record):
+        """Queue item for a screen that didn't change - metadata pointing at the last saved frame
+
+        Returns None if there is no earlier frame of that screen to point at.
+        """
+        folder = record['screen_folder']
+        reference = self.last_frames.get(folder) or self.store.latest_in_folder(folder)
+        if reference is None:
+            log_sync(f"Unchanged {record.get('screen')} with no earlier frame - not recorded", 'warning')
+            return None
+        captured_at = record.get('captured_at') or time.time()
+        name = time.strftime('%H-%M-%S', time.localtime(captured_at)) + '.unchanged'
+        marker = {
+            'file_path': os.path.join(folder, name),  # Never on disk - identifies the marker in the queue
+            'url_data': {},
+            'captured_at': captured_at,
+            'unchanged': True,
+            'change_ratio': record.get('change_ratio'),
+            'reference_path': reference['file_path']
+        }
+        if reference.get('sha256'):
+            marker['sha256'] = reference['sha256']
+        return marker
+
+    def _with_content_hash(self, item):
+        """Attach the file's SHA-256 to a queue item (left out if the file can't be read)"""
+        if self.dedup_enabled and 'sha256' not in item:
+            try:
+                item = {**item, 'sha256': file_sha256(item['file_path'])}
+            except OSError:
+                pass
+        return item
+
     def _get_file_path(self, item):
         """Extract file path from queue item (handles both dict and string)"""
         if isinstance(item, dict):
@@ -149,12 +352,14 @@ class SyncManager:
             return
         
         self.is_syncing = True
+        self.engine.start()
         self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
         self.sync_thread.start()
 
     def stop_sync(self):
         """Stop background sync process"""
         self.is_syncing = False
+        self.engine.stop()
         if self.sync_thread:
             self.sync_thread.join(timeout=2)
             self.sync_thread = None
@@ -167,62 +372,218 @@ class SyncManager:
             self.scan_local_files()
         
         while self.is_syncing:
+            # Compaction is local - it runs offline too, which is when the backlog grows
+            if self.compactor and time.time() - self.last_compaction >= COMPACTION_INTERVAL:
+                self.compact_backlog()
+            
             # Stop if access denied
             if self.access_denied_flag:
                 time.sleep(10)  # Wait longer if access denied
                 continue
             
             if self._is_online() and self.upload_queue:
-                self._process_queue_batch()
+                uploaded = self._process_queue_batch()
+                if uploaded and self.upload_queue and not self.access_denied_flag:
+                    continue  # Keep draining while uploads succeed - pacing comes from server responses
             time.sleep(5)  # Check every 5 seconds
 
     def _is_online(self):
-        """Check if internet is available"""
-        try:
-            requests.get("https://www.google.com", timeout=3)
-            return True
-        except:
-            return False
+        """Check if our API is reachable - probes only when idle or the offline backoff expired"""
+        return self.connectivity.check()
 
     def _process_queue_batch(self):
-        """Process upload queue in batches to avoid server overload"""
+        """Upload one batch concurrently - returns the number of files uploaded"""
         headers = self.auth_manager.get_auth_header()
         if not headers:
-            return
+            return 0
 
-        # Get batch of files to upload
-        batch = self.upload_queue[:self.batch_size]
-        
+        # Get batch of files to upload - items still backing off are skipped
+        self.upload_queue.release_due()
+        batch = self.upload_queue.head(self.batch_size)
         for item in batch:
-            if not self.is_syncing:
-                break
-            
-            success = self._upload_file(item, headers)
-            
-            # Get file path for tracking
+            self.store.set_state(self._get_file_path(item), IN_FLIGHT)
+        
+        # Upload concurrently - results are handled here, on the sync thread
+        uploaded = 0
+        for item, success in self._upload_batch(batch, headers):
             file_path = self._get_file_path(item)
-            
-            if success:
-                self.uploaded_files.add(file_path)
-                if item in self.upload_queue:
-                    self.upload_queue.remove(item)
+            if success is True:
+                self.store.mark_uploaded([file_path])
+                if item.get('sha256'):
+                    self.store.remember_hashes([item['sha256']])
+                self.upload_queue.remove(file_path)
+                uploaded += 1
                 if self.on_sync_callback:
                     self.on_sync_callback(file_path, True)
             else:
+                self._record_failure(file_path, transient=success == TRANSIENT)
                 if self.on_sync_callback:
                     self.on_sync_callback(file_path, False)
-            
-            # Small delay between individual uploads
-            time.sleep(0.5)
-        
-        self.save_queue()
+        return uploaded
+
+    def compact_backlog(self):
+        """Thin and re-encode old pending frames, recording each decision in the queue store"""
+        self.last_compaction = time.time()
+        try:
+            # Items backing off after a failure aren't backlog yet - the server may just be down
+            retrying = set(self.upload_queue.deferred) | self.store.paths_in_state(FAILED)
+            updated, dropped = self.compactor.compact(list(self.upload_queue), retrying)
+        except Exception as e:
+            log_sync(f"Backlog compaction error: {e}", 'error')
+            return
+        for item in dropped:
+            self.upload_queue.remove(item['file_path'])
+        for item in updated:
+            # Replace in place - same lane, same retry schedule
+            self.upload_queue.replace(item)
+        self.store.mark_compacted(dropped)
+        self.store.update_items(updated)
+
+    def _record_failure(self, file_path, transient=False):
+        """Back the item off with jitter, or dead-letter it after UPLOAD_MAX_ATTEMPTS"""
+        if self.access_denied_flag or self.engine.is_stopped() or not self.connectivity.is_online():
+            # Not this file's fault (denied, sync stopped/cancelled, offline) - no attempt counted
+            self.store.set_state(file_path, FAILED)
+            return
+        if transient:
+            # Throttled or the server/network is struggling - retry later, no attempt counted
+            self.store.set_state(file_path, FAILED)
+            next_attempt_at = time.time() + random.uniform(UPLOAD_RETRY_BASE_DELAY / 2, UPLOAD_RETRY_BASE_DELAY)
+            self.store.schedule_retry(file_path, next_attempt_at)
+            self.upload_queue.defer(file_path, next_attempt_at)
+            return
+        attempts = self.store.record_failure(file_path)
+        if attempts >= UPLOAD_MAX_ATTEMPTS:
+            log_sync(f"Giving up on {file_path} after {attempts} attempts (dead-lettered)", 'warning')
+            self.store.set_state(file_path, DEAD)
+            self.upload_queue.remove(file_path)
+            return
+        delay = min(UPLOAD_RETRY_MAX_DELAY, UPLOAD_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        next_attempt_at = time.time() + random.uniform(delay / 2, delay)  # Jitter spreads retries out
+        self.store.schedule_retry(file_path, next_attempt_at)
+        self.upload_queue.defer(file_path, next_attempt_at)
+
+    def get_dead_letters(self):
+        """Items that failed UPLOAD_MAX_ATTEMPTS times"""
+        return self.store.dead_items()
+
+    def replay_dead_letters(self, file_paths=None):
+        """Queue dead-lettered items (all, or the given paths) again"""
+        items = self.store.replay_dead(file_paths)
+        for item in items:
+            self.upload_queue.add(item)
+        return len(items)
+
+    def _upload_batch(self, batch, headers):
+        """Yield (item, success) - as bundles when enabled, single files otherwise"""
+        markers = [item for item in batch if isinstance(item, dict) and item.get('unchanged')]
+        files = [item for item in batch if item not in markers]
+        yield from self._upload_files(files, headers)
+        if markers:
+            # Last - a marker may point at a frame uploaded earlier in this same batch
+            yield from self.engine.run(lambda i: self._upload_marker(i, headers), markers)
+
+    def _upload_files(self, batch, headers):
+        """Yield (item, success) for frames with a file"""
+        if self.dedup_enabled and self.dedup_supported:
+            duplicates, batch = self._preflight(batch, headers)
+            yield from self.engine.run(lambda i: self._upload_reference(i, headers), duplicates)
+
+        if not (self.bundle_enabled and self.bundle_supported):
+            yield from self.engine.run(lambda i: self._upload_file(i, headers), batch)
+            return
+
+        # Large files keep their own resumable upload instead of riding in a bundle
+        fallback = [item for item in batch if self._wants_chunks(self._get_file_path(item))]
+        small = [item for item in batch if item not in fallback]
+        bundles = [small[i:i + self.bundle_size] for i in range(0, len(small), self.bundle_size)]
+        for bundle, results in self.engine.run(lambda b: self._upload_bundle(b, headers), bundles):
+            if results is None:
+                fallback.extend(bundle)  # Server can't take bundles - send these one by one
+                continue
+            for item in bundle:
+                yield item, results.get(self._get_file_path(item), False)
+        if fallback:
+            yield from self.engine.run(lambda i: self._upload_file(i, headers), fallback)
+
+    def _preflight(self, batch, headers):
+        """Split a batch into (duplicates, to_upload) by content hash
         
-        # Delay between batches if more files pending
-        if self.upload_queue:
-            time.sleep(self.batch_delay)
+        Hashes uploaded from this machine are answered locally; the rest are asked of the server.
+        """
+        batch = [self._with_content_hash(item) for item in batch]
+        hashes = {item['sha256'] for item in batch if item.get('sha256')}
+        have = self.store.known_hashes(hashes)
+        unknown = sorted(hashes - have)
+        if unknown:
+            try:
+                response = self.engine.post(API_SCREENSHOT_PREFLIGHT_URL, headers=headers,
+                                            json={'sha256': unknown}, timeout=15, priority=True)
+                if response.status_code in ENDPOINT_UNSUPPORTED_STATUSES:
+                    log_sync(f"Upload preflight not supported (HTTP {response.status_code}) - deduplication off", 'warning')
+                    self.dedup_supported = False
+                elif response.status_code == 200:
+                    have.update(h for h in response.json().get('have', []) if h in hashes)
+            except requests.exceptions.RequestException as e:
+                log_sync(f"Preflight error: {e}", 'warning')
 
-    def _upload_file(self, file_data, headers):
-        """Upload a single file with URL metadata to server"""
+        duplicates, to_upload, seen = [], [], set()
+        for item in batch:
+            content = item.get('sha256')
+            if content in have:
+                duplicates.append(item)
+            elif content and content in seen:
+                continue  # Same frame twice in this batch - it goes as a reference next round
+            else:
+                seen.add(content)
+                to_upload.append(item)
+        return duplicates, to_upload
+
+    def _upload_reference(self, file_data, headers):
+        """Send only the metadata of a frame whose content the server already has"""
+        file_path = self._get_file_path(file_data)
+        try:
+            file_path, data = self._upload_fields(file_data)
+            response = self.engine.post(API_SCREENSHOT_REFERENCE_URL, headers=headers, data=data,
+                                        timeout=15, priority=True)
+            if self._handle_auth_error(response):
+                return False
+            if response.status_code in [200, 201]:
+                return True
+            if response.status_code in TRANSIENT_STATUSES:
+                return TRANSIENT
+        except requests.exceptions.RequestException as e:
+            log_sync(f"Reference upload error for {file_path}: {e}", 'error')
+            return self._failure_for(e)
+        # The server no longer has that content (or can't link it) - send the file
+        return self._upload_file(file_data, headers)
+
+    def _upload_marker(self, file_data, headers):
+        """Record an unchanged screen against the frame it still shows - no file is sent"""
+        if file_data['reference_path'] in self.upload_queue:
+            return TRANSIENT  # The frame it points at isn't uploaded yet - wait for it, no attempt counted
+        file_path, data = self._upload_fields(file_data)
+        data.update({
+            'unchanged': True,
+            'reference_path': os.path.relpath(file_data['reference_path'], SCREENSHOTS_DIR),
+            'change_ratio': file_data.get('change_ratio'),
+            'captured_at': file_data['captured_at']
+        })
+        try:
+            response = self.engine.post(API_SCREENSHOT_REFERENCE_URL, headers=headers, data=data,
+                                        timeout=15, priority=True)
+        except requests.exceptions.RequestException as e:
+            log_sync(f"Unchanged marker upload error for {file_path}: {e}", 'error')
+            return self._failure_for(e)
+        if self._handle_auth_error(response):
+            return False
+        if response.status_code in TRANSIENT_STATUSES:
+            return TRANSIENT
+        # Anything else is the marker's own fault - retried with backoff, counted
+        return response.status_code in [200, 201]
+
+    def _upload_fields(self, file_data):
+        """Form fields describing one queue item - (file_path, data)"""
         # Extract file path and url data
         if isinstance(file_data, dict):
             file_path = file_data.get('file_path')
@@ -232,28 +593,62 @@ class SyncManager:
             file_path = file_data
             url_data = {}
         
+        # Extract relative path for server
+        rel_path = os.path.relpath(file_path, SCREENSHOTS_DIR)
+        
+        # Prepare data with URL metadata
+        data = {
+            'relative_path': rel_path,
+            'detected_url': url_data.get('detected_url', ''),
+            'detected_domain': url_data.get('detected_domain', ''),
+            'page_title': url_data.get('page_title', ''),
+            'browser_name': url_data.get('browser_name', ''),
+            'is_browser_active': url_data.get('is_browser_active', False),
+            'ocr_confidence': url_data.get('ocr_confidence', None),
+        }
+        if isinstance(file_data, dict) and file_data.get('sha256'):
+            data['content_sha256'] = file_data['sha256']
+        if isinstance(file_data, dict) and file_data.get('compaction'):
+            data['compaction'] = json.dumps(file_data['compaction'])  # Thinning/re-encode record
+        
+        # Delta frames carry their tile manifest and keyframe reference
+        if is_delta_file(file_path):
+            manifest = load_manifest(file_path)
+            if manifest:
+                data['frame_type'] = 'delta'
+                data['keyframe_path'] = manifest['keyframe']
+                data['delta_manifest'] = json.dumps(manifest)
+        return file_path, data
+
+    def _failure_for(self, error):
+        """Outcome for a request that raised - network trouble is transient"""
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return TRANSIENT
+        return False
+
+    def _handle_auth_error(self, response):
+        """Stop syncing on 401 or an account-level 403 - the API client updates auth and notifies"""
+        if self.api.handle_auth_errors(response, self.auth_manager):
+            self.access_denied_flag = True
+            return True
+        return False
+
+    def _upload_file(self, file_data, headers):
+        """Upload a single file with URL metadata to server"""
+        file_path = self._get_file_path(file_data)
         if not file_path or not os.path.exists(file_path):
             return True  # File doesn't exist, consider it "uploaded"
 
+        if self._wants_chunks(file_path):
+            result = self._upload_resumable(file_data, headers)
+            if result is not None:
+                return result
+
         try:
-            # Extract relative path for server
-            rel_path = os.path.relpath(file_path, SCREENSHOTS_DIR)
-            
+            file_path, data = self._upload_fields(file_data)
             with open(file_path, 'rb') as f:
                 files = {'file': (os.path.basename(file_path), f, 'image/webp')}
-                
-                # Prepare data with URL metadata
-                data = {
-                    'relative_path': rel_path,
-                    'detected_url': url_data.get('detected_url', ''),
-                    'detected_domain': url_data.get('detected_domain', ''),
-                    'page_title': url_data.get('page_title', ''),
-                    'browser_name': url_data.get('browser_name', ''),
-                    'is_browser_active': url_data.get('is_browser_active', False),
-                    'ocr_confidence': url_data.get('ocr_confidence', None),
-                }
-                
-                response = requests.post(
+                response = self.engine.post(
                     API_SCREENSHOT_UPLOAD_URL,
                     headers=headers,
                     files=files,
@@ -261,31 +656,172 @@ class SyncManager:
                     timeout=30
                 )
                 
-                # Handle 401 Unauthorized - token expired or invalid
-                if response.status_code == 401:
-                    print("401 Unauthorized - token may be expired")
-                    self.access_denied_flag = True
-                    try:
-                        data = response.json()
-                        message = data.get('detail', 'Session expired. Please login again.')
-                    except:
-                        message = 'Session expired. Please login again.'
-                    if self.on_access_denied:
-                        self.on_access_denied('TOKEN_EXPIRED', message)
-                    return False
-                
-                # Handle subscription/access denied
-                if response.status_code == 403:
-                    self._handle_403(response)
+                if self._handle_auth_error(response):
                     return False
-                
+                if response.status_code in TRANSIENT_STATUSES:
+                    return TRANSIENT
                 return response.status_code in [200, 201]
         except requests.exceptions.Timeout:
-            print(f"Upload timeout for {file_path}")
-            return False
+            log_sync(f"Upload timeout for {file_path}", 'warning')
+            return TRANSIENT
         except Exception as e:
-            print(f"Upload error for {file_path}: {e}")
+            log_sync(f"Upload error for {file_path}: {e}", 'warning')
+            return self._failure_for(e)
+
+    def _wants_chunks(self, file_path):
+        """Whether a file should go through the resumable chunked protocol"""
+        if not (self.resumable_enabled and self.resumable_supported):
             return False
+        try:
+            return os.path.getsize(file_path) >= UPLOAD_CHUNK_THRESHOLD
+        except OSError:
+            return False
+
+    def _upload_resumable(self, file_data, headers):
+        """Upload a large file in chunks, resuming from the last acknowledged offset
+        
+        Returns True/False, or None if the server doesn't support upload sessions.
+        """
+        file_path, data = self._upload_fields(file_data)
+        try:
+            size = os.path.getsize(file_path)
+            digest = (file_data.get('sha256') if isinstance(file_data, dict) else None) or file_sha256(file_path)
+            upload_id, offset = self.store.progress_of(file_path)
+            if upload_id:
+                offset = self._session_offset(upload_id, headers)  # The server's count wins
+            if not upload_id or offset is None:
+                response = self.engine.post(
+                    API_UPLOAD_SESSIONS_URL,
+                    headers=headers,
+                    json={**data, 'filename': os.path.basename(file_path), 'size': size, 'sha256': digest},
+                    timeout=15
+                )
+                if response.status_code in ENDPOINT_UNSUPPORTED_STATUSES:
+                    log_sync(f"Resumable uploads not supported (HTTP {response.status_code}) - using single uploads", 'warning')
+                    self.resumable_supported = False
+                    return None
+                if self._handle_auth_error(response):
+                    return False
+                if response.status_code in TRANSIENT_STATUSES:
+                    return TRANSIENT
+                if response.status_code not in [200, 201]:
+                    return False
+                upload_id, offset = response.json()['upload_id'], 0
+                self.store.set_progress(file_path, upload_id, offset)
+
+            session_url = f"{API_UPLOAD_SESSIONS_URL}{upload_id}/"
+            failures = 0
+            with open(file_path, 'rb') as f:
+                while offset < size:
+                    f.seek(offset)
+                    chunk = f.read(self.chunk_size)
+                    try:
+                        response = self.engine.request(
+                            'PATCH', session_url,
+                            headers={**headers, 'Upload-Offset': str(offset),
+                                     'Content-Type': 'application/offset+octet-stream'},
+                            data=chunk,
+                            timeout=30
+                        )
+                    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                        response = None
+                    if response is not None and self._handle_auth_error(response):
+                        return False
+                    if response is not None and response.status_code in [200, 204]:
+                        offset = int(response.headers.get('Upload-Offset', offset + len(chunk)))
+                    else:
+                        # Dropped or rejected chunk - ask the server how much it kept
+                        failures += 1
+                        offset = self._session_offset(upload_id, headers) if failures <= UPLOAD_CHUNK_RETRIES else None
+                        if offset is None:
+                            # Progress is saved - the next attempt resumes
+                            if response is None or response.status_code in TRANSIENT_STATUSES:
+                                return TRANSIENT
+                            return False
+                    self.store.set_progress(file_path, upload_id, offset)
+
+            response = self.engine.post(f"{session_url}complete/", headers=headers,
+                                        json={'sha256': digest}, timeout=30)
+            if self._handle_auth_error(response):
+                return False
+            if response.status_code == 409:
+                # Assembled bytes don't match our hash - start over with a new session
+                log_sync(f"Hash mismatch for {file_path} - restarting upload", 'warning')
+                self.store.set_progress(file_path, None, 0)
+                return False
+            if response.status_code in TRANSIENT_STATUSES:
+                return TRANSIENT
+            return response.status_code in [200, 201]
+        except requests.exceptions.RequestException as e:
+            log_sync(f"Resumable upload error for {file_path}: {e}", 'error')
+            return self._failure_for(e)
+
+    def _session_offset(self, upload_id, headers):
+        """Bytes the server holds for an upload session - None if it's gone or unreachable"""
+        try:
+            response = self.engine.request('HEAD', f"{API_UPLOAD_SESSIONS_URL}{upload_id}/",
+                                           headers=headers, timeout=15, priority=True)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            return None
+        if response.status_code != 200 or 'Upload-Offset' not in response.headers:
+            return None
+        return int(response.headers['Upload-Offset'])
+
+    def _upload_bundle(self, items, headers):
+        """Upload several files in one multipart request with a JSON manifest
+        
+        Returns {file_path: success}, or None if the server doesn't support bundles.
+        """
+        results, by_rel_path = {}, {}
+        manifest, files, handles = [], [], []
+        try:
+            for item in items:
+                file_path = self._get_file_path(item)
+                if not file_path or not os.path.exists(file_path):
+                    results[file_path] = True  # File doesn't exist, consider it "uploaded"
+                    continue
+                file_path, data = self._upload_fields(item)
+                part = f"file_{len(files)}"
+                manifest.append({'part': part, **data})
+                handle = open(file_path, 'rb')
+                handles.append(handle)
+                files.append((part, (os.path.basename(file_path), handle, 'image/webp')))
+                by_rel_path[data['relative_path']] = file_path
+                results[file_path] = False
+            if not files:
+                return results
+
+            response = self.engine.post(
+                API_SCREENSHOT_BUNDLE_URL,
+                headers=headers,
+                files=files,
+                data={'manifest': json.dumps(manifest)},
+                timeout=30 + 10 * len(files)
+            )
+            if response.status_code in ENDPOINT_UNSUPPORTED_STATUSES:
+                log_sync(f"Bundle uploads not supported (HTTP {response.status_code}) - using single uploads", 'warning')
+                self.bundle_supported = False
+                return None
+            if self._handle_auth_error(response):
+                return results
+            if response.status_code in TRANSIENT_STATUSES:
+                return {file_path: TRANSIENT if sent is False else sent for file_path, sent in results.items()}
+            if response.status_code not in [200, 201, 207]:
+                return results
+
+            # Per-item results: [{'relative_path': ..., 'status': 'created'|'exists'|'error'}, ...]
+            for entry in response.json().get('results', []):
+                file_path = by_rel_path.get(entry.get('relative_path'))
+                if file_path:
+                    results[file_path] = entry.get('status') in ('created', 'exists')
+            return results
+        except Exception as e:
+            log_sync(f"Bundle upload error: {e}", 'error')
+            failure = self._failure_for(e)
+            return {file_path: failure if sent is False else sent for file_path, sent in results.items()}
+        finally:
+            for handle in handles:
+                handle.close()
 
     def reset_access_denied(self):
         """Reset access denied flag - call when user re-authenticates"""
@@ -297,19 +833,25 @@ class SyncManager:
 
     def get_uploaded_count(self):
         """Get number of files already uploaded"""
-        return len(self.uploaded_files)
+        return self.store.count(UPLOADED)
 
     def get_queue_status(self):
         """Get sync status info"""
         return {
             'pending': len(self.upload_queue),
-            'uploaded': len(self.uploaded_files),
+            'uploaded': self.store.count(UPLOADED),
+            'retrying': self.upload_queue.deferred_count(),
+            'dead': self.store.count(DEAD),
+            **self.upload_queue.lane_counts(),
+            'upload_rate': int(self.engine.shaper.current_rate()),  # bytes/s, last 10 s
+            'upload_limit': self.engine.shaper.current_limit(),  # bytes/s, 0 = unlimited
             'is_syncing': self.is_syncing,
-            'is_online': self._is_online()
+            'is_online': self.connectivity.is_online(),  # Cached - never blocks
+            'connectivity': self.connectivity.get_state()
         }
 
     def force_rescan(self):
         """Force rescan of local files"""
         self.scan_local_files()
-        if self._is_online():
+        if self.connectivity.is_online():
             self.sync_with_server()
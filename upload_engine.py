@@ -0,0 +1,149 @@
+# upload_engine.py - Concurrent uploads over pooled keep-alive connections
+
+import time
+import threading
+import contextlib
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from config import UPLOAD_WORKERS, UPLOAD_PER_HOST_LIMIT, UPLOAD_MAX_BACKOFF
+from debug_logger import log_sync
+from bandwidth import BandwidthShaper
+from api_client import ApiClient, get_api_client
+
+
+class AdaptivePacer:
+    """Shared pause driven by server responses instead of fixed sleeps"""
+
+    def __init__(self, max_backoff=UPLOAD_MAX_BACKOFF):
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.resume_at = 0.0  # time.monotonic() before which no request is sent
+        self.lock = threading.Lock()
+
+    def wait(self, stop_event):
+        """Block until requests may be sent - returns False if stopped meanwhile"""
+        while True:
+            with self.lock:
+                delay = self.resume_at - time.monotonic()
+            if delay <= 0:
+                return True
+            if stop_event.wait(delay):
+                return False
+
+    def on_response(self, response):
+        """Back off on 429/503 (honouring Retry-After), recover on success"""
+        with self.lock:
+            if response.status_code in (429, 503):
+                retry_after = self._retry_after(response)
+                self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2))
+                delay = retry_after if retry_after is not None else self.backoff
+                self.resume_at = max(self.resume_at, time.monotonic() + delay)
+                log_sync(f"Server asked to slow down (HTTP {response.status_code}) - pausing {delay:.1f}s", 'warning')
+            elif response.status_code < 500:
+                self.backoff /= 2
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return min(self.max_backoff, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            # HTTP-date form
+            return min(self.max_backoff, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+
+class UploadEngine:
+    """Worker pool sending through the API client's connection pool"""
+
+    def __init__(self, workers=UPLOAD_WORKERS, per_host_limit=UPLOAD_PER_HOST_LIMIT, client=None):
+        self.workers = max(1, workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.client = client or ApiClient(pool_size=self.workers)  # Records latency and connectivity
+        self.pacer = AdaptivePacer()
+        self.shaper = BandwidthShaper(client=self.client)  # Token bucket over request bodies
+        self.stop_event = threading.Event()
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        self.executor = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.shaper.start()
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='upload')
+
+    def stop(self):
+        """Stop accepting work - in-flight requests finish on their own"""
+        self.stop_event.set()
+        self.shaper.stop()
+        executor, self.executor = self.executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def is_stopped(self):
+        """Whether stop() was called - outcomes since then say nothing about the item"""
+        return self.stop_event.is_set()
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, timeout=30, priority=False, **kwargs):
+        """Send through the shared session, respecting pacing, bandwidth and per-host limits
+        
+        Priority requests (metadata-only records) skip the bandwidth budget and the
+        per-host queue, so they never wait behind image uploads.
+        """
+        stop_event = threading.Event() if priority else self.stop_event
+        if not self.pacer.wait(stop_event):
+            raise requests.exceptions.ConnectionError("Upload engine stopped")
+        prepared = self.client.session.prepare_request(requests.Request(method, url, **kwargs))
+        body = prepared.body
+        size = len(body) if isinstance(body, (bytes, str)) else 0
+        if not priority and not self.shaper.consume(size, stop_event):
+            raise requests.exceptions.ConnectionError("Upload engine stopped")
+        with (contextlib.nullcontext() if priority else self._host_slot(url)):
+            response = self.client.send(prepared, timeout=timeout)
+        self.pacer.on_response(response)
+        return response
+
+    def run(self, func, items):
+        """Call func(item) on the worker pool - yields (item, result) as they finish"""
+        executor = self.executor
+        if not executor:
+            # Stopped - report everything as not uploaded so it stays queued
+            for item in items:
+                yield item, False
+            return
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result()
+            except Exception as e:
+                log_sync(f"Upload worker error: {e}", 'error')
+                yield item, False
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_slots[host]
+
+
+# Singleton instance
+_upload_engine = None
+
+def get_upload_engine():
+    """Get or create the shared upload engine"""
+    global _upload_engine
+    if _upload_engine is None:
+        _upload_engine = UploadEngine(client=get_api_client())
+    return _upload_engine
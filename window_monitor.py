@@ -3,6 +3,8 @@ Window Monitor - Get active window title and process name
 Simple cross-platform solution
 """
 
+import os
+import threading
 from debug_logger import log_browser
 
 # Platform-specific imports
@@ -31,18 +33,160 @@ except Exception as e:
     PLATFORM = 'unknown'
     log_browser(f"⚠️ Window Monitor initialization error: {e}", 'warning')
 
+# Linux: native X11 backend (python-xlib) - falls back to xdotool/wmctrl if missing
+XLIB_AVAILABLE = False
+if PLATFORM == 'linux':
+    try:
+        from Xlib import X, display as xdisplay
+        from Xlib.error import XError, ConnectionClosedError, CatchError, BadWindow
+        XLIB_AVAILABLE = True
+    except ImportError:
+        log_browser("python-xlib not installed, using xdotool for window detection", 'warning')
+
+
+class X11WindowBackend:
+    """Persistent X connection that tracks the active window via PropertyNotify"""
+    
+    def __init__(self, display_name=None):
+        self.display = xdisplay.Display(display_name)
+        self.root = self.display.screen().root
+        self.NET_ACTIVE_WINDOW = self.display.intern_atom('_NET_ACTIVE_WINDOW')
+        self.NET_WM_NAME = self.display.intern_atom('_NET_WM_NAME')
+        self.NET_WM_PID = self.display.intern_atom('_NET_WM_PID')
+        self.WM_NAME = self.display.intern_atom('WM_NAME')
+        self.UTF8_STRING = self.display.intern_atom('UTF8_STRING')
+        
+        self.lock = threading.Lock()
+        self.current = None  # Cached {'title', 'process'} of the active window
+        self.active_window = None
+        self.process_names = {}  # pid -> (process create time, name) - the time tells a reused pid apart
+        self.listeners = []
+        self.running = True
+        
+        # Root window properties tell us when focus moves
+        self.root.change_attributes(event_mask=X.PropertyChangeMask)
+        self._refresh()
+        self.thread = threading.Thread(target=self._event_loop, daemon=True)
+        self.thread.start()
+    
+    def is_alive(self):
+        return self.running and self.thread.is_alive()
+    
+    def get_active_window_info(self):
+        """Cached active window - no X round trip"""
+        with self.lock:
+            return dict(self.current) if self.current else None
+    
+    def add_listener(self, callback):
+        """Call callback(info) whenever the active window or its title changes"""
+        self.listeners.append(callback)
+    
+    def close(self):
+        self.running = False
+        try:
+            self.display.close()
+        except Exception:
+            pass
+    
+    def _event_loop(self):
+        """Block on X events and refresh the cache when focus or title changes"""
+        watched = (self.NET_ACTIVE_WINDOW, self.NET_WM_NAME, self.WM_NAME)
+        while self.running:
+            try:
+                event = self.display.next_event()
+                if event.type == X.PropertyNotify and event.atom in watched:
+                    self._refresh()
+            except ConnectionClosedError:
+                break
+            except XError as e:
+                log_browser(f"X11 event error: {e}", 'warning')
+            except Exception as e:
+                log_browser(f"X11 window backend stopped: {e}", 'error')
+                break
+        self.running = False
+    
+    def _refresh(self):
+        """Re-read the active window's title and PID (event thread only)"""
+        info = None
+        try:
+            prop = self.root.get_full_property(self.NET_ACTIVE_WINDOW, X.AnyPropertyType)
+            window_id = prop.value[0] if prop and len(prop.value) else 0
+            if window_id:
+                window = self.display.create_resource_object('window', window_id)
+                if window_id != self.active_window:
+                    # Follow title changes (e.g. browser tab switches) on the new window only
+                    self._unwatch_active()
+                    window.change_attributes(event_mask=X.PropertyChangeMask)
+                    self.active_window = window_id
+                info = {'title': self._window_title(window), 'process': self._window_process(window)}
+            else:
+                self._unwatch_active()
+        except XError:
+            # Window vanished between the event and the lookup
+            info = None
+        
+        with self.lock:
+            changed = info != self.current
+            self.current = info
+        if changed and info:
+            for callback in self.listeners:
+                try:
+                    callback(dict(info))
+                except Exception as e:
+                    log_browser(f"Window listener error: {e}", 'error')
+    
+    def _unwatch_active(self):
+        """Stop title events from the window that just lost focus"""
+        if self.active_window:
+            window = self.display.create_resource_object('window', self.active_window)
+            # The window may already be destroyed - ignore BadWindow
+            window.change_attributes(event_mask=X.NoEventMask, onerror=CatchError(BadWindow))
+            self.active_window = None
+
+    def _window_title(self, window):
+        prop = window.get_full_property(self.NET_WM_NAME, self.UTF8_STRING)
+        if prop and prop.value:
+            value = prop.value
+            return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
+        name = window.get_wm_name()
+        return name.decode('latin-1') if isinstance(name, bytes) else (name or '')
+    
+    def _window_process(self, window):
+        prop = window.get_full_property(self.NET_WM_PID, X.AnyPropertyType)
+        if not prop or not len(prop.value):
+            return 'unknown'
+        pid = int(prop.value[0])
+        try:
+            import psutil
+            process = psutil.Process(pid)
+            created = process.create_time()
+            cached = self.process_names.get(pid)
+            if not cached or cached[0] != created:
+                cached = self.process_names[pid] = (created, process.name())
+            return cached[1]
+        except Exception:
+            return 'unknown'
+
 
 class WindowMonitor:
     """Monitor active window to get title and process name"""
     
     def __init__(self):
-        pass
+        self.x11 = None
+        if XLIB_AVAILABLE and os.environ.get('DISPLAY'):
+            try:
+                self.x11 = X11WindowBackend()
+                log_browser("✅ Native X11 window backend connected")
+            except Exception as e:
+                log_browser(f"X11 backend unavailable, using xdotool: {e}", 'warning')
     
     def get_active_window_info(self):
         """Get active window title and process name"""
         if PLATFORM == 'windows':
             return self._get_windows_active_window()
         elif PLATFORM == 'linux':
+            if self.x11 and self.x11.is_alive():
+                return self.x11.get_active_window_info()
             return self._get_linux_active_window()
         elif PLATFORM == 'macos':
             return self._get_macos_active_window()
@@ -66,34 +210,27 @@ class WindowMonitor:
     def _get_linux_active_window(self):
         """Get active window on Linux"""
         try:
-            # Try xdotool first
+            # Try xdotool first - one process prints both title and PID
             result = subprocess.run(
-                ['xdotool', 'getactivewindow', 'getwindowname'],
+                ['xdotool', 'getactivewindow', 'getwindowname', 'getwindowpid'],
                 capture_output=True,
                 text=True,
                 timeout=1
             )
             
-            if result.returncode == 0:
-                title = result.stdout.strip()
+            # getwindowpid fails for windows without _NET_WM_PID - keep the title anyway
+            if result.returncode == 0 or result.stdout.strip():
+                lines = result.stdout.strip().split('\n')
+                title = lines[0].strip()
                 
                 # Get process name
-                pid_result = subprocess.run(
-                    ['xdotool', 'getactivewindow', 'getwindowpid'],
-                    capture_output=True,
-                    text=True,
-                    timeout=1
-                )
-                
-                if pid_result.returncode == 0:
-                    pid = int(pid_result.stdout.strip())
+                process = 'unknown'
+                if len(lines) > 1 and lines[-1].strip().isdigit():
                     try:
                         import psutil
-                        process = psutil.Process(pid).name()
+                        process = psutil.Process(int(lines[-1])).name()
                     except:
-                        process = 'unknown'
-                else:
-                    process = 'unknown'
+                        pass
                 
                 return {'title': title, 'process': process}
         except FileNotFoundError:
@@ -145,3 +282,16 @@ def get_window_monitor():
     if _window_monitor is None:
         _window_monitor = WindowMonitor()
     return _window_monitor
+
+
+if __name__ == '__main__':
+    # Manual check (works against Xvfb): DISPLAY=:99 python window_monitor.py
+    import time
+    monitor = get_window_monitor()
+    backend = 'x11' if monitor.x11 else PLATFORM
+    for _ in range(10):
+        started = time.perf_counter()
+        info = monitor.get_active_window_info()
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(f"[{backend}] {elapsed_us:8.1f} us  {info}")
+        time.sleep(1)